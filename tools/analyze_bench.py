@@ -0,0 +1,89 @@
+"""
+Benchmark for the class analyzer (analyze_classes).
+
+Times, over a directory or archive of extracted class files, or the
+classes of a JIMAGE read in memory:
+  - read            loading every class file (iter_class_files)
+  - hierarchy       class/super/interfaces of every class (header only)
+  - parse           JavaClassAnalyzer on every class, fully decoded
+  - report          analyze_all, parse plus the full report
+
+and reports classes/s and MB/s, using jimage_bench's best-of-N timing.
+
+Usage:
+  python analyze_bench.py                                # extracted parser module
+  python analyze_bench.py extracted/ch.iddqd.aoe4.parser --repeat 5
+  python analyze_bench.py classes.zip --prefix ch.iddqd.aoe4.parser/
+  python analyze_bench.py lib/modules --prefix ch.iddqd.aoe4.parser/
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+from analyze_classes import JavaClassAnalyzer, analyze_all, iter_class_files
+from jimage_bench import best_of, print_results
+
+
+def load_classes(source, prefix=None):
+    """Read every class file of source into memory: [(path, data)]."""
+    classes = []
+    for path, data in iter_class_files(source, prefix):
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        classes.append((path, data))
+    return classes
+
+
+def run_benchmarks(source, prefix=None, repeat=3):
+    """Run every benchmark on source; return result rows for print_results."""
+    rows = []
+    t, classes = best_of(repeat, lambda: load_classes(source, prefix))
+    size = sum(len(data) for _, data in classes)
+    rows.append(('read', t, len(classes), size))
+
+    def hierarchy():
+        return {a.class_name: (a.super_name, a.interfaces)
+                for a in (JavaClassAnalyzer(path, data) for path, data in classes)}
+    t, _ = best_of(repeat, hierarchy)
+    rows.append(('hierarchy', t, len(classes), size))
+
+    def parse_all():
+        analyzers = [JavaClassAnalyzer(path, data) for path, data in classes]
+        for a in analyzers:
+            a.parse()
+        return analyzers
+    t, _ = best_of(repeat, parse_all)
+    rows.append(('parse', t, len(classes), size))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = os.path.join(tmp, 'report.txt')
+
+        def full_report():
+            with contextlib.redirect_stdout(io.StringIO()):
+                analyze_all(source, report, prefix)
+        t, _ = best_of(repeat, full_report)
+        rows.append(('report', t, len(classes), size))
+
+    print(f"Source: {source} ({len(classes)} classes, {size / 1e6:.1f} MB)")
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the class analyzer on extracted classes.")
+    ap.add_argument('source', nargs='?',
+                    default="C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted/ch.iddqd.aoe4.parser",
+                    help="directory of .class files, a .zip/.tar from extract_jimage --archive, "
+                         "or a JIMAGE (lib/modules)")
+    ap.add_argument('--prefix', help="only use archive or image classes under this path")
+    ap.add_argument('--repeat', type=int, default=3, help="runs per benchmark (best is reported)")
+    args = ap.parse_args()
+
+    print_results(run_benchmarks(args.source, args.prefix, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
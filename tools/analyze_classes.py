@@ -4,254 +4,456 @@ Extracts constant pools, field/method signatures, and string constants
 to understand the parser architecture.
 """
 
+import argparse
+import gc
+import hashlib
+import pickle
+import re
 import struct
 import os
-import sys
+import tarfile
+import zipfile
+import zlib
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+from extract_jimage import iter_image_resources
+from jimage_parser import JIMAGE_MAGIC, JIMAGE_MAGIC_INVERTED, JImageParser
+
+# The module the report and exports describe
+PARSER_MODULE = 'ch.iddqd.aoe4.parser'
+PARSER_VERSION = '0.9.7-SNAPSHOT'
+
+# Precompiled big-endian readers for the class file structures
+U2 = struct.Struct('>H')
+CLASS_HEADER = struct.Struct('>IHHH')        # magic, minor, major, constant_pool_count
+CLASS_INFO = struct.Struct('>HHHH')          # access_flags, this, super, interfaces_count
+MEMBER_HEADER = struct.Struct('>HHHH')       # access, name, descriptor, attributes_count
+ATTRIBUTE_HEADER = struct.Struct('>HI')      # name index, length
+
+CODE_HEADER = struct.Struct('>HHI')         # max_stack, max_locals, code_length
+
+# Opcode -> instruction length in bytes; 0 for the variable-length
+# tableswitch, lookupswitch and wide (see _instruction_length)
+OPCODE_LENGTHS = [1] * 256
+for _ops, _length in (((0x10, 0x12, 0xa9, 0xbc, *range(0x15, 0x1a), *range(0x36, 0x3b)), 2),
+                      ((0x11, 0x13, 0x14, 0x84, 0xbb, 0xbd, 0xc0, 0xc1, 0xc6, 0xc7,
+                        *range(0x99, 0xa9), *range(0xb2, 0xb9)), 3),
+                      ((0xc5,), 4),
+                      ((0xb9, 0xba, 0xc8, 0xc9), 5),
+                      ((0xaa, 0xab, 0xc4), 0)):
+    for _op in _ops:
+        OPCODE_LENGTHS[_op] = _length
+del _ops, _length, _op
+
+# Constant pool tag -> (entry name, unpack_from, payload size, takes two slots)
+# for every tag but UTF8 (1), whose payload is length-prefixed
+CONSTANT_PARSERS = {}
+for _tag, _name, _fmt in (
+        (3, 'Integer', '>i'), (4, 'Float', '>f'), (5, 'Long', '>q'), (6, 'Double', '>d'),
+        (7, 'Class', '>H'), (8, 'String', '>H'), (9, 'Fieldref', '>HH'),
+        (10, 'Methodref', '>HH'), (11, 'InterfaceMethodref', '>HH'),
+        (12, 'NameAndType', '>HH'), (15, 'MethodHandle', '>BH'), (16, 'MethodType', '>H'),
+        (17, 'Dynamic', '>HH'), (18, 'InvokeDynamic', '>HH'), (19, 'Module', '>H'),
+        (20, 'Package', '>H')):
+    _st = struct.Struct(_fmt)
+    CONSTANT_PARSERS[_tag] = (_name, _st.unpack_from, _st.size, _tag in (5, 6))
+del _tag, _name, _fmt, _st
+
+# Constant pool tag -> entry size including the tag byte (0: UTF8 or unknown)
+CONSTANT_ENTRY_SIZES = [0] * 256
+for _tag, (_, _, _size, _) in CONSTANT_PARSERS.items():
+    CONSTANT_ENTRY_SIZES[_tag] = 1 + _size
+del _tag, _size
+
+
+class ConstantPool:
+    """Array-backed constant pool of one class file.
+
+    tags[i] is the tag of entry i (0 for index 0 and the second slot of a
+    Long/Double) and offsets[i] is where the entry starts in data; operands
+    are read from data when asked for and UTF8 entries are decoded once,
+    on first use. Indexing returns the same tuples a list of parsed
+    entries would, e.g. pool[5] -> ('Methodref', 12, 34).
+    """
+
+    __slots__ = ('data', 'tags', 'offsets', '_utf8')
+
+    def __init__(self, data, tags, offsets):
+        self.data = data
+        self.tags = tags
+        self.offsets = offsets
+        self._utf8 = {}
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __getitem__(self, idx):
+        tag = self.tags[idx]
+        if tag == 0:
+            return None
+        if tag == 1:
+            return ('UTF8', self.utf8(idx))
+        name, unpack, _, _ = CONSTANT_PARSERS[tag]
+        return (name, *unpack(self.data, self.offsets[idx] + 1))
+
+    def __iter__(self):
+        for idx in range(len(self.tags)):
+            yield self[idx]
+
+    def utf8(self, idx):
+        """Decoded UTF8 entry idx; the caller checks that tags[idx] == 1."""
+        s = self._utf8.get(idx)
+        if s is None:
+            pos = self.offsets[idx]
+            length = U2.unpack_from(self.data, pos + 1)[0]
+            s = self._utf8[idx] = str(self.data[pos + 3:pos + 3 + length], 'utf-8', 'replace')
+        return s
+
+    def u2(self, idx, operand=0):
+        """The operand-th u2 operand of entry idx (e.g. a Class's name index)."""
+        return U2.unpack_from(self.data, self.offsets[idx] + 1 + 2 * operand)[0]
+
+    def indexes(self, tag):
+        """Indexes of all entries with the given tag, in pool order."""
+        tags = self.tags
+        return [i for i in range(len(tags)) if tags[i] == tag]
+
+
+class FieldInfo:
+    """A field_info record. Also readable like the old dicts: f['name']."""
+
+    __slots__ = ('access', 'name', 'descriptor', 'constant_value')
+
+    def __init__(self, access, name, descriptor, constant_value=None):
+        self.access = access
+        self.name = name
+        self.descriptor = descriptor
+        self.constant_value = constant_value
+
+    @property
+    def attributes(self):
+        return {} if self.constant_value is None else {'ConstantValue': self.constant_value}
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __reduce__(self):
+        return FieldInfo, (self.access, self.name, self.descriptor, self.constant_value)
+
 
+class MethodInfo:
+    """A method_info record. Also readable like the old dicts: m['name']."""
 
-class JavaClassAnalyzer:
-    """Parse a Java .class file and extract useful information."""
+    __slots__ = ('access', 'name', 'descriptor')
 
-    def __init__(self, filepath):
+    def __init__(self, access, name, descriptor):
+        self.access = access
+        self.name = name
+        self.descriptor = descriptor
+
+    def __getitem__(self, key):
+        return getattr(self, key)
+
+    def __reduce__(self):
+        return MethodInfo, (self.access, self.name, self.descriptor)
+
+
+class ClassInfo:
+    """Access-flag helpers shared by JavaClassAnalyzer and ClassSummary."""
+
+    __slots__ = ()
+
+    def is_enum(self):
+        return (self.access_flags & 0x4000) != 0
+
+    def is_interface(self):
+        return (self.access_flags & 0x0200) != 0
+
+    def is_abstract(self):
+        return (self.access_flags & 0x0400) != 0
+
+    def access_str(self):
+        parts = []
+        if self.access_flags & 0x0001: parts.append('public')
+        if self.access_flags & 0x0010: parts.append('final')
+        if self.access_flags & 0x0020: parts.append('super')
+        if self.access_flags & 0x0200: parts.append('interface')
+        if self.access_flags & 0x0400: parts.append('abstract')
+        if self.access_flags & 0x1000: parts.append('synthetic')
+        if self.access_flags & 0x2000: parts.append('annotation')
+        if self.access_flags & 0x4000: parts.append('enum')
+        if self.access_flags & 0x8000: parts.append('module')
+        return ' '.join(parts)
+
+    def method_access_str(self, acc):
+        parts = []
+        if acc & 0x0001: parts.append('public')
+        if acc & 0x0002: parts.append('private')
+        if acc & 0x0004: parts.append('protected')
+        if acc & 0x0008: parts.append('static')
+        if acc & 0x0010: parts.append('final')
+        if acc & 0x0040: parts.append('bridge')
+        if acc & 0x0080: parts.append('varargs')
+        if acc & 0x0100: parts.append('native')
+        if acc & 0x0400: parts.append('abstract')
+        return ' '.join(parts)
+
+    def field_access_str(self, acc):
+        parts = []
+        if acc & 0x0001: parts.append('public')
+        if acc & 0x0002: parts.append('private')
+        if acc & 0x0004: parts.append('protected')
+        if acc & 0x0008: parts.append('static')
+        if acc & 0x0010: parts.append('final')
+        if acc & 0x0040: parts.append('volatile')
+        if acc & 0x0080: parts.append('transient')
+        if acc & 0x1000: parts.append('synthetic')
+        if acc & 0x4000: parts.append('enum')
+        return ' '.join(parts)
+
+
+
+class JavaClassAnalyzer(ClassInfo):
+    """Parse a Java .class file and extract useful information.
+
+    data is the class file as bytes or a memoryview (e.g. a resource
+    view of a JIMAGE); without it the file at filepath is read.
+    Construction only walks the constant pool layout and reads the access
+    flags, this/super class and interfaces. The constant pool entries
+    (cp), fields and methods are decoded on first access.
+    """
+
+    def __init__(self, filepath, data=None):
         self.filepath = filepath
-        with open(filepath, 'rb') as f:
-            self.data = f.read()
-        self.pos = 0
-        self.cp = [None]  # 1-indexed
-        self.fields = []
-        self.methods = []
+        if data is None:
+            with open(filepath, 'rb') as f:
+                data = f.read()
+        self.data = data
+        self._cp = None
+        self._fields = None
+        self._methods = None
+        self._clinit_code = None
         self.class_name = ''
         self.super_name = ''
         self.interfaces = []
-        self.parse()
+        self.parse_header()
 
-    def read_u1(self):
-        val = self.data[self.pos]
-        self.pos += 1
-        return val
-
-    def read_u2(self):
-        val = struct.unpack_from('>H', self.data, self.pos)[0]
-        self.pos += 2
-        return val
-
-    def read_u4(self):
-        val = struct.unpack_from('>I', self.data, self.pos)[0]
-        self.pos += 4
-        return val
-
-    def read_i4(self):
-        val = struct.unpack_from('>i', self.data, self.pos)[0]
-        self.pos += 4
-        return val
-
-    def read_i8(self):
-        val = struct.unpack_from('>q', self.data, self.pos)[0]
-        self.pos += 8
-        return val
-
-    def read_f4(self):
-        val = struct.unpack_from('>f', self.data, self.pos)[0]
-        self.pos += 4
-        return val
-
-    def read_f8(self):
-        val = struct.unpack_from('>d', self.data, self.pos)[0]
-        self.pos += 8
-        return val
+    def parse_header(self):
+        """Index the constant pool and read the class info block.
 
-    def parse(self):
-        # Magic
-        magic = self.read_u4()
+        Entries are located, not decoded: this only fills the tag and
+        offset arrays of the ConstantPool.
+        """
+        data = self.data
+        magic, self.minor, self.major, cp_count = CLASS_HEADER.unpack_from(data, 0)
         assert magic == 0xCAFEBABE
+        pos = CLASS_HEADER.size
 
-        # Version
-        self.minor = self.read_u2()
-        self.major = self.read_u2()
-
-        # Constant pool
-        cp_count = self.read_u2()
+        tags = bytearray(max(cp_count, 1))
+        offsets = array('I', bytes(4 * len(tags)))
+        sizes = CONSTANT_ENTRY_SIZES
+        u2 = U2.unpack_from
         i = 1
         while i < cp_count:
-            tag = self.read_u1()
-            if tag == 1:  # UTF8
-                length = self.read_u2()
-                s = self.data[self.pos:self.pos+length].decode('utf-8', errors='replace')
-                self.pos += length
-                self.cp.append(('UTF8', s))
-            elif tag == 3:  # Integer
-                self.cp.append(('Integer', self.read_i4()))
-            elif tag == 4:  # Float
-                self.cp.append(('Float', self.read_f4()))
-            elif tag == 5:  # Long
-                self.cp.append(('Long', self.read_i8()))
-                i += 1
-                self.cp.append(None)
-            elif tag == 6:  # Double
-                self.cp.append(('Double', self.read_f8()))
-                i += 1
-                self.cp.append(None)
-            elif tag == 7:  # Class
-                self.cp.append(('Class', self.read_u2()))
-            elif tag == 8:  # String
-                self.cp.append(('String', self.read_u2()))
-            elif tag == 9:  # Fieldref
-                self.cp.append(('Fieldref', self.read_u2(), self.read_u2()))
-            elif tag == 10:  # Methodref
-                self.cp.append(('Methodref', self.read_u2(), self.read_u2()))
-            elif tag == 11:  # InterfaceMethodref
-                self.cp.append(('InterfaceMethodref', self.read_u2(), self.read_u2()))
-            elif tag == 12:  # NameAndType
-                self.cp.append(('NameAndType', self.read_u2(), self.read_u2()))
-            elif tag == 15:  # MethodHandle
-                self.cp.append(('MethodHandle', self.read_u1(), self.read_u2()))
-            elif tag == 16:  # MethodType
-                self.cp.append(('MethodType', self.read_u2()))
-            elif tag == 17:  # Dynamic
-                self.cp.append(('Dynamic', self.read_u2(), self.read_u2()))
-            elif tag == 18:  # InvokeDynamic
-                self.cp.append(('InvokeDynamic', self.read_u2(), self.read_u2()))
-            elif tag == 19:  # Module
-                self.cp.append(('Module', self.read_u2()))
-            elif tag == 20:  # Package
-                self.cp.append(('Package', self.read_u2()))
+            offsets[i] = pos
+            tag = tags[i] = data[pos]
+            size = sizes[tag]
+            if size > 0:
+                pos += size
+                if tag == 5 or tag == 6:  # Long/Double take two slots
+                    i += 1
+            elif tag == 1:  # UTF8
+                pos += 3 + u2(data, pos + 1)[0]
             else:
-                raise ValueError(f"Unknown constant pool tag {tag} at position {self.pos-1}")
+                raise ValueError(f"Unknown constant pool tag {tag} at position {pos}")
             i += 1
+        self._cp = ConstantPool(data, tags, offsets)
 
-        # Access flags
-        self.access_flags = self.read_u2()
-
-        # This class
-        this_idx = self.read_u2()
+        self.access_flags, this_idx, super_idx, iface_count = CLASS_INFO.unpack_from(data, pos)
+        pos += CLASS_INFO.size
         self.class_name = self.resolve_class_name(this_idx)
-
-        # Super class
-        super_idx = self.read_u2()
         if super_idx > 0:
             self.super_name = self.resolve_class_name(super_idx)
-
-        # Interfaces
-        iface_count = self.read_u2()
-        for _ in range(iface_count):
-            idx = self.read_u2()
+        for idx in struct.unpack_from(f'>{iface_count}H', data, pos):
             self.interfaces.append(self.resolve_class_name(idx))
+        self._members_pos = pos + 2 * iface_count
+
+    @property
+    def cp(self):
+        """The ConstantPool; cp[i] is a tuple such as ('Class', 12), or None."""
+        return self._cp
+
+    @property
+    def fields(self):
+        """FieldInfo records, decoded on first access."""
+        if self._fields is None:
+            self._parse_members()
+        return self._fields
+
+    @property
+    def methods(self):
+        """MethodInfo records, decoded on first access."""
+        if self._methods is None:
+            self._parse_members()
+        return self._methods
+
+    def parse(self):
+        """Decode the fields and methods now instead of on first access."""
+        if self._fields is None:
+            self._parse_members()
+
+    def _parse_members(self):
+        data = self.data
+        pos = self._members_pos
+        resolve_utf8 = self.resolve_utf8
+        member = MEMBER_HEADER.unpack_from
+        attribute = ATTRIBUTE_HEADER.unpack_from
 
         # Fields
-        fields_count = self.read_u2()
+        fields = []
+        fields_count = U2.unpack_from(data, pos)[0]
+        pos += 2
         for _ in range(fields_count):
-            facc = self.read_u2()
-            fname_idx = self.read_u2()
-            fdesc_idx = self.read_u2()
-            fname = self.resolve_utf8(fname_idx)
-            fdesc = self.resolve_utf8(fdesc_idx)
-
-            # Read field attributes (skip for now)
-            fattrs_count = self.read_u2()
-            fattr_data = {}
+            facc, fname_idx, fdesc_idx, fattrs_count = member(data, pos)
+            pos += MEMBER_HEADER.size
+            constant_value = None
             for _ in range(fattrs_count):
-                aname_idx = self.read_u2()
-                alen = self.read_u4()
-                aname = self.resolve_utf8(aname_idx)
-                if aname == 'ConstantValue':
-                    cv_idx = self.read_u2()
-                    fattr_data['ConstantValue'] = cv_idx
-                else:
-                    self.pos += alen
-
-            self.fields.append({
-                'access': facc,
-                'name': fname,
-                'descriptor': fdesc,
-                'attributes': fattr_data,
-            })
-
-        # Methods
-        methods_count = self.read_u2()
+                aname_idx, alen = attribute(data, pos)
+                pos += ATTRIBUTE_HEADER.size
+                if resolve_utf8(aname_idx) == 'ConstantValue':
+                    constant_value = U2.unpack_from(data, pos)[0]
+                pos += alen
+            fields.append(FieldInfo(facc, resolve_utf8(fname_idx), resolve_utf8(fdesc_idx),
+                                    constant_value))
+
+        # Methods (attributes are skipped, except where <clinit>'s code is)
+        methods = []
+        methods_count = U2.unpack_from(data, pos)[0]
+        pos += 2
         for _ in range(methods_count):
-            macc = self.read_u2()
-            mname_idx = self.read_u2()
-            mdesc_idx = self.read_u2()
-            mname = self.resolve_utf8(mname_idx)
-            mdesc = self.resolve_utf8(mdesc_idx)
-
-            mattrs_count = self.read_u2()
+            macc, mname_idx, mdesc_idx, mattrs_count = member(data, pos)
+            pos += MEMBER_HEADER.size
+            mname = resolve_utf8(mname_idx)
             for _ in range(mattrs_count):
-                aname_idx = self.read_u2()
-                alen = self.read_u4()
-                self.pos += alen
-
-            self.methods.append({
-                'access': macc,
-                'name': mname,
-                'descriptor': mdesc,
-            })
+                aname_idx, alen = attribute(data, pos)
+                pos += ATTRIBUTE_HEADER.size
+                if mname == '<clinit>' and resolve_utf8(aname_idx) == 'Code':
+                    self._clinit_code = pos
+                pos += alen
+            methods.append(MethodInfo(macc, mname, resolve_utf8(mdesc_idx)))
+        self._fields = fields
+        self._methods = methods
 
     def resolve_utf8(self, idx):
-        if idx < 1 or idx >= len(self.cp) or self.cp[idx] is None:
+        cp = self._cp
+        if idx < 1 or idx >= len(cp) or cp.tags[idx] == 0:
             return f'<unresolved:{idx}>'
-        entry = self.cp[idx]
-        if entry[0] == 'UTF8':
-            return entry[1]
-        return f'<not-utf8:{idx}>'
+        if cp.tags[idx] != 1:
+            return f'<not-utf8:{idx}>'
+        return cp.utf8(idx)
 
     def resolve_class_name(self, idx):
-        if idx < 1 or idx >= len(self.cp) or self.cp[idx] is None:
+        cp = self._cp
+        if idx < 1 or idx >= len(cp) or cp.tags[idx] == 0:
             return f'<unresolved:{idx}>'
-        entry = self.cp[idx]
-        if entry[0] == 'Class':
-            return self.resolve_utf8(entry[1])
-        return f'<not-class:{idx}>'
+        if cp.tags[idx] != 7:
+            return f'<not-class:{idx}>'
+        return self.resolve_utf8(cp.u2(idx))
 
     def get_string_constants(self):
         """Get all String constants from the constant pool."""
-        strings = []
-        for entry in self.cp:
-            if entry and entry[0] == 'String':
-                s = self.resolve_utf8(entry[1])
-                strings.append(s)
-        return strings
+        cp = self._cp
+        return [self.resolve_utf8(cp.u2(i)) for i in cp.indexes(8)]
 
     def get_integer_constants(self):
         """Get all Integer constants."""
-        ints = []
-        for entry in self.cp:
-            if entry and entry[0] == 'Integer':
-                ints.append(entry[1])
-        return ints
+        return [self._cp[i][1] for i in self._cp.indexes(3)]
 
     def get_long_constants(self):
         """Get all Long constants."""
-        longs = []
-        for entry in self.cp:
-            if entry and entry[0] == 'Long':
-                longs.append(entry[1])
-        return longs
+        return [self._cp[i][1] for i in self._cp.indexes(5)]
 
     def get_float_constants(self):
-        floats = []
-        for entry in self.cp:
-            if entry and entry[0] == 'Float':
-                floats.append(entry[1])
-        return floats
+        return [self._cp[i][1] for i in self._cp.indexes(4)]
 
     def get_referenced_classes(self):
         """Get all referenced class names."""
+        cp = self._cp
         classes = set()
-        for entry in self.cp:
-            if entry and entry[0] == 'Class':
-                name = self.resolve_utf8(entry[1])
-                if not name.startswith('['):  # Skip array types
-                    classes.add(name)
+        for i in cp.indexes(7):
+            name = self.resolve_utf8(cp.u2(i))
+            if not name.startswith('['):  # Skip array types
+                classes.add(name)
         return sorted(classes)
 
+    def get_static_int_constants(self):
+        """(name, value) of every int field with a ConstantValue, in field order."""
+        cp = self._cp
+        return [(f.name, cp[f.constant_value][1]) for f in self.fields
+                if f.constant_value is not None and f.descriptor == 'I'
+                and f.constant_value < len(cp) and cp.tags[f.constant_value] == 3]
+
+    def get_enum_constant_ids(self):
+        """(name, value) of every enum constant built with an int argument.
+
+        Walks the <clinit> bytecode: each constant is created by
+        new/dup/<name>/<ordinal>/<arguments>/invokespecial/putstatic, and
+        its value is the first int pushed after the ordinal (e.g. the id
+        of BuildingGeneratedTypeEnum(String, int, int value)). Constants
+        without an int argument are left out. Returns [] for classes that
+        are not enums or have no static initializer.
+        """
+        self.parse()
+        if not self.is_enum() or self._clinit_code is None:
+            return []
+        data = self.data
+        cp = self._cp
+        tags = cp.tags
+        own_type = f'L{self.class_name};'
+        own_prefix = self.class_name + '$'
+        start = self._clinit_code + CODE_HEADER.size
+        end = start + CODE_HEADER.unpack_from(data, self._clinit_code)[2]
+
+        results = []
+        ints = None  # ints pushed since the last `new` of this enum (or a constant body)
+        pc = start
+        while pc < end:
+            op = data[pc]
+            if ints is not None:
+                if 0x02 <= op <= 0x08:  # iconst_m1 .. iconst_5
+                    ints.append(op - 3)
+                elif op == 0x10:  # bipush
+                    ints.append(struct.unpack_from('>b', data, pc + 1)[0])
+                elif op == 0x11:  # sipush
+                    ints.append(struct.unpack_from('>h', data, pc + 1)[0])
+                elif op == 0x12 or op == 0x13:  # ldc, ldc_w
+                    idx = data[pc + 1] if op == 0x12 else U2.unpack_from(data, pc + 1)[0]
+                    if tags[idx] == 3:
+                        ints.append(cp[idx][1])
+            if op == 0xbb:  # new
+                name = self.resolve_class_name(U2.unpack_from(data, pc + 1)[0])
+                if name == self.class_name or name.startswith(own_prefix):
+                    ints = []
+            elif op == 0xb3 and ints is not None:  # putstatic
+                _, nat_idx = cp[U2.unpack_from(data, pc + 1)[0]][1:]
+                _, name_idx, desc_idx = cp[nat_idx]
+                if self.resolve_utf8(desc_idx) == own_type:
+                    if len(ints) > 1:
+                        results.append((self.resolve_utf8(name_idx), ints[1]))
+                    ints = None
+            pc += _instruction_length(data, pc, start)
+        return results
+
     def get_constant_field_values(self):
         """Get static final field values."""
         results = {}
         for f in self.fields:
-            if 'ConstantValue' in f['attributes']:
-                cv_idx = f['attributes']['ConstantValue']
+            if f.constant_value is not None:
+                cv_idx = f.constant_value
                 if cv_idx < len(self.cp) and self.cp[cv_idx] is not None:
                     entry = self.cp[cv_idx]
                     if entry[0] in ('Integer', 'Long', 'Float', 'Double'):
@@ -260,494 +462,909 @@ class JavaClassAnalyzer:
                         results[f['name']] = self.resolve_utf8(entry[1])
         return results
 
-    def is_enum(self):
-        return (self.access_flags & 0x4000) != 0
 
-    def is_interface(self):
-        return (self.access_flags & 0x0200) != 0
+def _instruction_length(code, pc, start):
+    """Length of the instruction at pc; start is where the method's code begins."""
+    op = code[pc]
+    length = OPCODE_LENGTHS[op]
+    if length:
+        return length
+    if op == 0xc4:  # wide
+        return 6 if code[pc + 1] == 0x84 else 4
+    pad = 3 - (pc - start) % 4
+    if op == 0xaa:  # tableswitch
+        low, high = struct.unpack_from('>ii', code, pc + 1 + pad + 4)
+        return 1 + pad + 12 + 4 * (high - low + 1)
+    npairs = struct.unpack_from('>i', code, pc + 1 + pad + 4)[0]  # lookupswitch
+    return 1 + pad + 8 + 8 * npairs
+
+
+class ClassSummary(ClassInfo):
+    """What analyze_all reports about one class, without the class bytes.
+
+    Small and picklable, so that analyze_all(jobs=...) workers can send it
+    back instead of a whole JavaClassAnalyzer. Answers the same queries
+    the report makes of an analyzer.
+    """
+
+    __slots__ = ('filepath', 'class_name', 'super_name', 'interfaces', 'access_flags',
+                 'fields', 'methods', 'string_constants', 'integer_constants',
+                 'constant_field_values', 'referenced_classes', 'enum_constant_ids')
+
+    def __init__(self, analyzer):
+        self.filepath = analyzer.filepath
+        self.class_name = analyzer.class_name
+        self.super_name = analyzer.super_name
+        self.interfaces = analyzer.interfaces
+        self.access_flags = analyzer.access_flags
+        self.fields = analyzer.fields
+        self.methods = analyzer.methods
+        self.string_constants = analyzer.get_string_constants()
+        self.integer_constants = analyzer.get_integer_constants()
+        self.constant_field_values = analyzer.get_constant_field_values()
+        self.referenced_classes = analyzer.get_referenced_classes()
+        self.enum_constant_ids = analyzer.get_enum_constant_ids()
+
+    def __getstate__(self):
+        # Members travel as plain tuples: much cheaper to unpickle than
+        # thousands of FieldInfo/MethodInfo reductions
+        state = [getattr(self, k) for k in self.__slots__]
+        state[5] = [(f.access, f.name, f.descriptor, f.constant_value) for f in self.fields]
+        state[6] = [(m.access, m.name, m.descriptor) for m in self.methods]
+        return tuple(state)
+
+    def __setstate__(self, state):
+        for k, v in zip(self.__slots__, state):
+            setattr(self, k, v)
+        self.fields = [FieldInfo(*f) for f in self.fields]
+        self.methods = [MethodInfo(*m) for m in self.methods]
 
-    def is_abstract(self):
-        return (self.access_flags & 0x0400) != 0
+    def get_string_constants(self):
+        return self.string_constants
 
-    def access_str(self):
-        parts = []
-        if self.access_flags & 0x0001: parts.append('public')
-        if self.access_flags & 0x0010: parts.append('final')
-        if self.access_flags & 0x0020: parts.append('super')
-        if self.access_flags & 0x0200: parts.append('interface')
-        if self.access_flags & 0x0400: parts.append('abstract')
-        if self.access_flags & 0x1000: parts.append('synthetic')
-        if self.access_flags & 0x2000: parts.append('annotation')
-        if self.access_flags & 0x4000: parts.append('enum')
-        if self.access_flags & 0x8000: parts.append('module')
-        return ' '.join(parts)
+    def get_integer_constants(self):
+        return self.integer_constants
 
-    def method_access_str(self, acc):
-        parts = []
-        if acc & 0x0001: parts.append('public')
-        if acc & 0x0002: parts.append('private')
-        if acc & 0x0004: parts.append('protected')
-        if acc & 0x0008: parts.append('static')
-        if acc & 0x0010: parts.append('final')
-        if acc & 0x0040: parts.append('bridge')
-        if acc & 0x0080: parts.append('varargs')
-        if acc & 0x0100: parts.append('native')
-        if acc & 0x0400: parts.append('abstract')
-        return ' '.join(parts)
+    def get_constant_field_values(self):
+        return self.constant_field_values
 
-    def field_access_str(self, acc):
-        parts = []
-        if acc & 0x0001: parts.append('public')
-        if acc & 0x0002: parts.append('private')
-        if acc & 0x0004: parts.append('protected')
-        if acc & 0x0008: parts.append('static')
-        if acc & 0x0010: parts.append('final')
-        if acc & 0x0040: parts.append('volatile')
-        if acc & 0x0080: parts.append('transient')
-        if acc & 0x1000: parts.append('synthetic')
-        if acc & 0x4000: parts.append('enum')
-        return ' '.join(parts)
+    def get_referenced_classes(self):
+        return self.referenced_classes
+
+    def get_enum_constant_ids(self):
+        return self.enum_constant_ids
+
+
+# Class name keywords the report sections select classes by
+REPORT_KEYWORDS = (
+    'CommandType', 'ParserProvider',
+    'EntityType', 'BuildingType', 'UnitType', 'EntityDirectory', 'EntityEntry', 'GaiaType',
+    'ResourceType',
+    'ReplayParser', 'Replay', 'HeaderParser', 'CommandParser', 'MessageParser', 'MapParser',
+    'PlayerParser', 'SettingParser',
+    'Command', 'Coordinates', 'Building', 'Unit', 'Entity', 'Resource', 'SubCommand',
+    'Parser', 'Filter', 'Type',
+    'LEData', 'Printer', 'Logger', 'GameLog', 'ApmGraph',
+    'GeneratedType',
+    'Translations', 'MapInfo', 'MapInitializer', 'Actions', 'Age',
+    'Header', 'Player', 'Setting', 'Color', 'CustomMap', 'Map',
+)
+
+
+class _PerClass(dict):
+    """class name -> analyzers[name].<method>(), computed on first lookup."""
+
+    def __init__(self, analyzers, method):
+        super().__init__()
+        self.analyzers = analyzers
+        self.method = method
+
+    def __missing__(self, name):
+        value = self[name] = getattr(self.analyzers[name], self.method)()
+        return value
+
+
+class ClassIndex:
+    """Cross-class indexes over analyzed classes.
+
+    analyzers maps class name -> JavaClassAnalyzer (or ClassSummary). One
+    pass over the classes builds:
+      strings          class -> string constants
+      string_classes   string constant -> classes that use it
+      references       class -> classes it references
+      implementors     interface -> classes implementing it
+      subclasses       super class -> direct subclasses
+      packages         package -> classes
+      by_keyword       name keyword -> classes whose name contains it
+    The other per-class constants the report prints are computed once,
+    when first looked up:
+      integers, constant_values   class -> constants
+    Class lists are in analyzers order; names is every class, sorted.
+    """
+
+    def __init__(self, analyzers, keywords=REPORT_KEYWORDS):
+        self.analyzers = analyzers
+        self.names = sorted(analyzers)
+        self.strings = {}
+        self.integers = _PerClass(analyzers, 'get_integer_constants')
+        self.constant_values = _PerClass(analyzers, 'get_constant_field_values')
+        self.string_classes = defaultdict(list)
+        self.references = {}
+        self.implementors = defaultdict(list)
+        self.subclasses = defaultdict(list)
+        self.packages = defaultdict(list)
+        self.by_keyword = {kw: [] for kw in keywords}
+
+        # One list per distinct string constant: keep the cycle collector
+        # from rescanning every analyzer while they are allocated
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for name, a in analyzers.items():
+                strings = self.strings[name] = a.get_string_constants()
+                for s in dict.fromkeys(strings):
+                    self.string_classes[s].append(name)
+                self.references[name] = a.get_referenced_classes()
+                for iface in a.interfaces:
+                    self.implementors[iface].append(name)
+                if a.super_name:
+                    self.subclasses[a.super_name].append(name)
+                self.packages[name.rsplit('/', 1)[0] if '/' in name else ''].append(name)
+                for kw, found in self.by_keyword.items():
+                    if kw in name:
+                        found.append(name)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
 
+    def keyword(self, kw):
+        """Classes whose name contains kw, in analyzers order."""
+        found = self.by_keyword.get(kw)
+        if found is None:
+            found = self.by_keyword[kw] = [name for name in self.analyzers if kw in name]
+        return found
 
+    def matching(self, keywords, exclude=()):
+        """Sorted classes whose name contains any of keywords and none of exclude."""
+        selected = set()
+        for kw in keywords:
+            selected.update(self.keyword(kw))
+        for kw in exclude:
+            selected.difference_update(self.keyword(kw))
+        return sorted(selected)
+
+
+# Field descriptor char -> Java type name
+PRIMITIVE_TYPES = {
+    'B': 'byte', 'C': 'char', 'D': 'double', 'F': 'float',
+    'I': 'int', 'J': 'long', 'S': 'short', 'Z': 'boolean', 'V': 'void'
+}
+
+# One field type token: array dimensions, then a primitive or an L...; class
+DESCRIPTOR_TOKEN = re.compile(r'(\[*)(?:([BCDFIJSZV])|L([^;]*);)')
+
+# Distinct descriptors kept by each of the parse/format caches
+DESCRIPTOR_CACHE_SIZE = 8192
+
+
+class FieldType:
+    """A parsed field (or return) type: element type name and array depth."""
+
+    __slots__ = ('name', 'dims', 'display')
+
+    def __init__(self, name, dims=0):
+        self.name = name
+        self.dims = dims
+        self.display = name + '[]' * dims
+
+    def __repr__(self):
+        return f"FieldType({self.display!r})"
+
+
+class MethodType:
+    """A parsed method descriptor: parameter FieldTypes and the return FieldType."""
+
+    __slots__ = ('params', 'returns', 'display')
+
+    def __init__(self, params, returns):
+        self.params = params
+        self.returns = returns
+        self.display = f"({', '.join(p.display for p in params)}) -> {returns.display}"
+
+    def __repr__(self):
+        return f"MethodType({self.display!r})"
+
+
+def _field_type(match):
+    dims, primitive, class_name = match.groups()
+    if primitive is not None:
+        return FieldType(PRIMITIVE_TYPES[primitive], len(dims))
+    return FieldType(class_name.replace('/', '.'), len(dims))
+
+
+@lru_cache(maxsize=DESCRIPTOR_CACHE_SIZE)
+def parse_descriptor(desc):
+    """Parse a field descriptor (e.g. '[Ljava/lang/String;') into a FieldType.
+
+    Anything that is not a valid descriptor keeps its text as the name.
+    """
+    match = DESCRIPTOR_TOKEN.fullmatch(desc)
+    if match is not None:
+        return _field_type(match)
+    element = desc.lstrip('[')
+    return FieldType(element, len(desc) - len(element))
+
+
+@lru_cache(maxsize=DESCRIPTOR_CACHE_SIZE)
+def parse_method_descriptor(desc):
+    """Parse a method descriptor (e.g. '(I[B)V') into a MethodType, or None.
+
+    The parameter list is tokenized in one pass; characters that start no
+    type are skipped.
+    """
+    close = desc.find(')')
+    if not desc.startswith('(') or close < 0:
+        return None
+    params = tuple(_field_type(m) for m in DESCRIPTOR_TOKEN.finditer(desc, 1, close))
+    return MethodType(params, parse_descriptor(desc[close + 1:]))
+
+
+@lru_cache(maxsize=DESCRIPTOR_CACHE_SIZE)
 def format_descriptor(desc):
     """Convert Java type descriptor to human-readable form."""
-    mapping = {
-        'B': 'byte', 'C': 'char', 'D': 'double', 'F': 'float',
-        'I': 'int', 'J': 'long', 'S': 'short', 'Z': 'boolean', 'V': 'void'
-    }
-    if desc in mapping:
-        return mapping[desc]
-    if desc.startswith('['):
-        return format_descriptor(desc[1:]) + '[]'
-    if desc.startswith('L') and desc.endswith(';'):
-        return desc[1:-1].replace('/', '.')
-    return desc
+    return parse_descriptor(desc).display
 
 
+@lru_cache(maxsize=DESCRIPTOR_CACHE_SIZE)
 def format_method_desc(desc):
     """Convert method descriptor to human-readable form."""
-    # Parse (params)return
-    if not desc.startswith('('):
-        return desc
-    close = desc.index(')')
-    params_str = desc[1:close]
-    ret_str = desc[close+1:]
-
-    params = []
-    i = 0
-    while i < len(params_str):
-        if params_str[i] in 'BCDFIJSZV':
-            params.append(format_descriptor(params_str[i]))
-            i += 1
-        elif params_str[i] == '[':
-            j = i
-            while params_str[j] == '[':
-                j += 1
-            if params_str[j] == 'L':
-                end = params_str.index(';', j)
-                params.append(format_descriptor(params_str[i:end+1]))
-                i = end + 1
+    method = parse_method_descriptor(desc)
+    return desc if method is None else method.display
+
+
+def is_jimage(path):
+    """True if path is a JIMAGE (lib/modules) file."""
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    return len(magic) == 4 and struct.unpack('<I', magic)[0] in (JIMAGE_MAGIC, JIMAGE_MAGIC_INVERTED)
+
+
+def iter_class_files(source, prefix=None):
+    """Yield (path, data) for every .class file in sorted path order.
+
+    source is a directory (walked; data is None and read by the analyzer),
+    a .zip/.tar archive written by extract_jimage --archive (members are
+    read in place) or a JIMAGE file (classes are decompressed in memory,
+    never written to disk). Archive and image paths can be limited to
+    those under prefix, e.g. 'ch.iddqd.aoe4.parser/'; for an image only
+    the module named by the prefix is read.
+    """
+    if os.path.isdir(source):
+        class_files = []
+        for root, dirs, files in os.walk(source):
+            for f in files:
+                if f.endswith('.class'):
+                    class_files.append(os.path.join(root, f))
+        for cf in sorted(class_files):
+            yield cf, None
+        return
+
+    prefix = prefix or ''
+    if is_jimage(source):
+        modules = [prefix.split('/')[0]] if prefix else None
+        with JImageParser(source) as image:
+            classes = []
+            for entry, content in iter_image_resources(image, modules):
+                name = entry['full_path'].lstrip('/')
+                if name.startswith(prefix):
+                    classes.append((name, content))
+            classes.sort(key=lambda item: item[0])
+            for name, content in classes:
+                yield f"{source}:{name}", content
+    elif zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as zf:
+            names = sorted(n for n in zf.namelist()
+                           if n.startswith(prefix) and n.endswith('.class'))
+            for name in names:
+                yield f"{source}:{name}", zf.read(name)
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source) as tf:
+            members = sorted((m for m in tf.getmembers()
+                              if m.isfile() and m.name.startswith(prefix) and m.name.endswith('.class')),
+                             key=lambda m: m.name)
+            for m in members:
+                yield f"{source}:{m.name}", tf.extractfile(m).read()
+    else:
+        raise ValueError(f"Not a directory or class archive: {source}")
+
+
+def _summarize_task(item):
+    """Worker side of analyze_all: (path, ClassSummary or None, error)."""
+    cf, data = item
+    try:
+        a = JavaClassAnalyzer(cf, data)
+        a.parse()
+        return cf, ClassSummary(a), None
+    except Exception as e:
+        return cf, None, str(e)
+
+
+def _analyze_items(items, jobs=1):
+    """Yield (path, JavaClassAnalyzer or ClassSummary, error) for each (path, data), in order.
+
+    With jobs > 1 the classes are parsed in a process pool and come back
+    as ClassSummary objects.
+    """
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            # memoryviews of an image cannot be pickled; send the workers bytes
+            items = ((cf, bytes(data) if isinstance(data, memoryview) else data)
+                     for cf, data in items)
+            yield from pool.map(_summarize_task, items, chunksize=64)
+        return
+    for cf, data in items:
+        try:
+            a = JavaClassAnalyzer(cf, data)
+            a.parse()
+            yield cf, a, None
+        except Exception as e:
+            yield cf, None, str(e)
+
+
+# Class cache: a header (magic, version, payload size, payload digest)
+# followed by the zlib-compressed pickle of {class file digest: pickled
+# ClassSummary state}. States are pickled one by one so that a rewrite
+# only pickles the classes that were parsed again.
+CLASS_CACHE_MAGIC = b'JCLSCACH'
+CLASS_CACHE_VERSION = 4
+CLASS_CACHE_HEADER = struct.Struct('<8sIQ16s')
+
+
+def class_digest(data):
+    """Content key of a class file in the class cache."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def load_class_cache(cache_path):
+    """Return the cached {digest: pickled ClassSummary state}, or {} if missing, stale or corrupt."""
+    try:
+        with open(cache_path, 'rb') as f:
+            blob = f.read()
+    except OSError:
+        return {}
+    if len(blob) < CLASS_CACHE_HEADER.size:
+        return {}
+    magic, version, payload_size, digest = CLASS_CACHE_HEADER.unpack_from(blob, 0)
+    payload = memoryview(blob)[CLASS_CACHE_HEADER.size:]
+    if (magic != CLASS_CACHE_MAGIC or version != CLASS_CACHE_VERSION
+            or len(payload) != payload_size
+            or hashlib.blake2b(payload, digest_size=16).digest() != digest):
+        return {}
+    try:
+        return pickle.loads(zlib.decompress(payload))
+    except Exception:
+        return {}
+
+
+def save_class_cache(cache_path, states):
+    """Write {digest: pickled ClassSummary state} to cache_path atomically.
+
+    Failures are reported, not raised.
+    """
+    payload = zlib.compress(pickle.dumps(states, pickle.HIGHEST_PROTOCOL), 1)
+    header = CLASS_CACHE_HEADER.pack(CLASS_CACHE_MAGIC, CLASS_CACHE_VERSION, len(payload),
+                                     hashlib.blake2b(payload, digest_size=16).digest())
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write class cache {cache_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _cached_summaries(items, cache_path, jobs=1):
+    """Like _analyze_items, but only parse classes that are not in the class cache.
+
+    The cache is rewritten to hold exactly the classes of this run when
+    anything was added or dropped; every result is a ClassSummary.
+    """
+    # Rebuilding the cached summaries allocates millions of objects that
+    # all stay alive; with the cycle collector on, its repeated full
+    # passes cost more than the unpickling itself.
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        cached = load_class_cache(cache_path)
+        keyed = []
+        misses = []
+        for cf, data in items:
+            if data is None:
+                with open(cf, 'rb') as f:
+                    data = f.read()
+            key = class_digest(data)
+            keyed.append((cf, key))
+            if key not in cached:
+                misses.append((cf, data))
+
+        parsed = {}
+        errors = {}
+        for cf, result, error in _analyze_items(misses, jobs):
+            if error is not None:
+                errors[cf] = error
             else:
-                params.append(format_descriptor(params_str[i:j+1]))
-                i = j + 1
-        elif params_str[i] == 'L':
-            end = params_str.index(';', i)
-            params.append(format_descriptor(params_str[i:end+1]))
-            i = end + 1
-        else:
-            i += 1
-
-    ret = format_descriptor(ret_str)
-    return f"({', '.join(params)}) -> {ret}"
+                parsed[cf] = result if isinstance(result, ClassSummary) else ClassSummary(result)
+        del misses
+
+        results = []
+        states = {}
+        for cf, key in keyed:
+            summary = parsed.get(cf)
+            if summary is not None:
+                states[key] = pickle.dumps(summary.__getstate__(), pickle.HIGHEST_PROTOCOL)
+            elif key in cached:
+                summary = ClassSummary.__new__(ClassSummary)
+                summary.__setstate__(pickle.loads(cached[key]))
+                summary.filepath = cf
+                states[key] = cached[key]
+            results.append((cf, summary, errors.get(cf)))
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    print(f"Class cache: {len(keyed) - len(parsed) - len(errors)} cached, {len(parsed)} parsed")
+    if parsed or states.keys() != cached.keys():
+        save_class_cache(cache_path, states)
+    return results
+
+
+def _banner(title):
+    return "=" * 80 + "\n" + title + "\n" + "=" * 80 + "\n\n"
+
+
+def _kind(a):
+    return 'enum' if a.is_enum() else 'interface' if a.is_interface() else 'abstract class' if a.is_abstract() else 'class'
+
+
+def _field_line(a, f, indent):
+    return f"{indent}{a.field_access_str(f['access'])} {format_descriptor(f['descriptor'])} {f['name']}\n"
+
+
+def _method_lines(a, skip, indent):
+    for m in a.methods:
+        if m['name'] not in skip:
+            yield f"{indent}{a.method_access_str(m['access'])} {m['name']}{format_method_desc(m['descriptor'])}\n"
+
+
+def _string_lines(strings, limit=None, indent="    "):
+    for s in strings if limit is None else islice(strings, limit):
+        yield f"{indent}\"{s}\"\n"
+
+
+# Each section is a generator of report lines taking (analyzers, index).
+# Sections only read the analyzers and the ClassIndex, so any one of them
+# can be produced on its own (see write_report).
+
+def section_overview(analyzers, index):
+    yield _banner("1. ARCHITECTURE OVERVIEW")
+    yield "Packages:\n"
+    packages = index.packages
+    for pkg in sorted(packages.keys()):
+        yield f"  {pkg.replace('/', '.')} ({len(packages[pkg])} classes)\n"
+
+    yield "\n\nClass Hierarchy:\n"
+    for name in index.names:
+        a = analyzers[name]
+        line = f"  {_kind(a)} {name.split('/')[-1]}"
+        super_short = a.super_name.split('/')[-1] if a.super_name else ''
+        if super_short and super_short != 'Object' and super_short != 'Enum':
+            line += f" extends {super_short}"
+        if a.interfaces:
+            line += f" implements {', '.join(i.split('/')[-1] for i in a.interfaces)}"
+        yield line + "\n"
+
+
+def section_command_types(analyzers, index):
+    yield _banner("2. COMMAND TYPE MAPPINGS")
+
+    # Look for CommandType enum
+    for name in index.keyword('CommandType'):
+        a = analyzers[name]
+        if not a.is_enum():
+            continue
+        yield f"Enum: {name.replace('/', '.')}\n"
+        for f in a.fields:
+            if f['access'] & 0x4000:  # enum constant
+                yield f"  {f['name']}\n"
+        yield "\n"
+        # Show string constants that might be command type names
+        strings = index.strings[name]
+        if strings:
+            yield "  String constants:\n"
+            yield from _string_lines(strings)
+        yield "\n"
+
+    # Look for ParserProvider which maps command types to parsers
+    for name in index.keyword('ParserProvider'):
+        a = analyzers[name]
+        yield f"\nParserProvider: {name.replace('/', '.')}\n"
+        yield "  Methods:\n"
+        yield from _method_lines(a, ('<init>', '<clinit>'), "    ")
+        strings = index.strings[name]
+        ints = index.integers[name]
+        if ints:
+            yield f"  Integer constants (possible command type IDs): {ints}\n"
+        if strings:
+            yield "  String constants:\n"
+            yield from _string_lines(strings)
+
+
+def section_entity_types(analyzers, index):
+    yield _banner("3. ENTITY/BUILDING/UNIT TYPE DEFINITIONS")
+
+    for name in index.matching(['EntityType', 'BuildingType', 'UnitType', 'EntityDirectory',
+                                'EntityEntry', 'GaiaType', 'ResourceType']):
+        a = analyzers[name]
+        yield f"\n--- {name.split('/')[-1]} ---\n"
+        yield f"  Full name: {name.replace('/', '.')}\n"
+
+        if a.is_enum():
+            yield "  Type: enum\n"
+            enum_fields = [f for f in a.fields if f['access'] & 0x4000]
+            yield f"  Enum constants ({len(enum_fields)}):\n"
+            for f in enum_fields:
+                yield f"    {f['name']}\n"
+
+        yield "  Fields:\n"
+        for f in a.fields:
+            if not (f['access'] & 0x4000):  # skip enum constants
+                yield _field_line(a, f, "    ")
+
+        yield "  Methods:\n"
+        yield from _method_lines(a, ('<init>', '<clinit>', 'values', 'valueOf'), "    ")
+
+        # Show constant values
+        cv = index.constant_values[name]
+        if cv:
+            yield "  Constant values:\n"
+            for k, v in cv.items():
+                yield f"    {k} = {v}\n"
+
+        # String constants (entity names, IDs)
+        strings = index.strings[name]
+        if strings and len(strings) <= 50:
+            yield f"  String constants ({len(strings)}):\n"
+            yield from _string_lines(strings)
+        elif strings:
+            yield f"  String constants: {len(strings)} total (first 30):\n"
+            yield from _string_lines(strings, 30)
+            yield f"    ... and {len(strings)-30} more\n"
+
+        # Integer constants (type IDs)
+        ints = index.integers[name]
+        if ints:
+            yield f"  Integer constants ({len(ints)}): {ints[:50]}\n"
+
+
+def section_replay_parser(analyzers, index):
+    yield _banner("4. REPLAY PARSER - Main Parsing Logic")
+
+    for name in index.matching(['ReplayParser', 'Replay', 'HeaderParser', 'CommandParser',
+                                'MessageParser', 'MapParser', 'PlayerParser', 'SettingParser']):
+        a = analyzers[name]
+        yield f"\n--- {name.split('/')[-1]} ---\n"
+        yield f"  Full name: {name.replace('/', '.')}\n"
+        if a.super_name:
+            yield f"  Extends: {a.super_name.replace('/', '.')}\n"
+        if a.interfaces:
+            yield f"  Implements: {', '.join(i.replace('/', '.') for i in a.interfaces)}\n"
+
+        yield "  Fields:\n"
+        for f in a.fields:
+            yield _field_line(a, f, "    ")
+
+        yield "  Methods:\n"
+        yield from _method_lines(a, ('<clinit>',), "    ")
+
+        ints = index.integers[name]
+        if ints:
+            yield f"  Integer constants: {ints}\n"
+
+        strings = index.strings[name]
+        if strings:
+            yield f"  String constants ({len(strings)}):\n"
+            yield from _string_lines(strings, 50)
+            if len(strings) > 50:
+                yield f"    ... and {len(strings)-50} more\n"
+
+
+def section_data_structures(analyzers, index):
+    yield _banner("5. DATA STRUCTURES (Command Types, Coordinates, etc.)")
+
+    for name in index.matching(['Command', 'Coordinates', 'Building', 'Unit', 'Entity',
+                                'Resource', 'SubCommand'],
+                               exclude=['Parser', 'Filter', 'Type']):
+        a = analyzers[name]
+        yield f"\n--- {name.split('/')[-1]} ---\n"
+        yield f"  Full name: {name.replace('/', '.')}\n"
+        if a.super_name and 'Object' not in a.super_name:
+            yield f"  Extends: {a.super_name.split('/')[-1]}\n"
+        if a.interfaces:
+            yield f"  Implements: {', '.join(i.split('/')[-1] for i in a.interfaces)}\n"
+
+        yield "  Fields:\n"
+        for f in a.fields:
+            yield _field_line(a, f, "    ")
+
+        yield "  Methods:\n"
+        yield from _method_lines(a, ('<clinit>', '<init>', 'values', 'valueOf',
+                                     'toString', 'hashCode', 'equals'), "    ")
+
+        strings = index.strings[name]
+        if strings and len(strings) <= 20:
+            yield f"  String constants: {strings}\n"
+
+
+def section_utilities(analyzers, index):
+    yield _banner("6. UTILITY CLASSES")
+
+    for name in index.matching(['LEData', 'Printer', 'Logger', 'GameLog', 'ApmGraph']):
+        a = analyzers[name]
+        yield f"\n--- {name.split('/')[-1]} ---\n"
+        yield f"  Full name: {name.replace('/', '.')}\n"
+
+        yield "  Methods:\n"
+        yield from _method_lines(a, ('<clinit>', '<init>'), "    ")
+
+
+def section_generated_types(analyzers, index):
+    yield _banner("7. GENERATED TYPE ENUMS (Entity ID Mappings)")
+
+    for name in index.matching(['GeneratedType']):
+        a = analyzers[name]
+        if not a.is_enum():
+            continue
+        enum_fields = [f for f in a.fields if f['access'] & 0x4000]
+        yield f"\n--- {name.split('/')[-1]} ({len(enum_fields)} entries) ---\n"
+
+        # Show first 50 enum constants
+        for f in islice(enum_fields, 50):
+            yield f"  {f['name']}\n"
+        if len(enum_fields) > 50:
+            yield f"  ... and {len(enum_fields)-50} more\n"
+
+        # Show non-enum fields (which might include ID mappings)
+        non_enum_fields = [f for f in a.fields if not (f['access'] & 0x4000)]
+        if non_enum_fields:
+            yield "  Non-enum fields:\n"
+            for f in non_enum_fields:
+                yield _field_line(a, f, "    ")
+
+        # Integer constants are the actual type IDs
+        ints = index.integers[name]
+        if ints:
+            yield f"  Integer constants ({len(ints)} values, first 50): {ints[:50]}\n"
+
+        strings = index.strings[name]
+        if strings:
+            yield f"  String constants ({len(strings)}, first 20): {strings[:20]}\n"
+
+
+def section_translations(analyzers, index):
+    yield _banner("8. TRANSLATIONS, MAP INFO & GAME LOG")
+
+    for name in index.matching(['Translations', 'MapInfo', 'MapInitializer',
+                                'GameLog', 'Actions', 'Age']):
+        a = analyzers[name]
+        yield f"\n--- {name.split('/')[-1]} ---\n"
+        yield f"  Full name: {name.replace('/', '.')}\n"
+
+        if a.is_enum():
+            yield f"  Enum constants: {[f['name'] for f in a.fields if f['access'] & 0x4000]}\n"
+
+        non_enum_fields = [f for f in a.fields if not (f['access'] & 0x4000)]
+        if non_enum_fields:
+            yield "  Fields:\n"
+            for f in non_enum_fields:
+                yield _field_line(a, f, "    ")
+
+        yield "  Methods:\n"
+        yield from _method_lines(a, ('<clinit>', '<init>', 'values', 'valueOf'), "    ")
+
+        strings = index.strings[name]
+        if strings and len(strings) <= 30:
+            yield f"  String constants: {strings}\n"
+        elif strings:
+            yield f"  String constants ({len(strings)}, first 30): {strings[:30]}\n"
+
+
+def section_info_structures(analyzers, index):
+    yield _banner("9. HEADER & INFO STRUCTURES")
+
+    for name in index.matching(['Header', 'Player', 'Setting', 'Color', 'CustomMap', 'Map'],
+                               exclude=['Parser', 'Type', 'Command']):
+        a = analyzers[name]
+        yield f"\n--- {name.split('/')[-1]} ---\n"
+        yield f"  Full name: {name.replace('/', '.')}\n"
+
+        yield "  Fields:\n"
+        for f in a.fields:
+            yield _field_line(a, f, "    ")
+
+        yield "  Methods:\n"
+        yield from _method_lines(a, ('<clinit>',), "    ")
+
+        cv = index.constant_values[name]
+        if cv:
+            yield f"  Constant values: {cv}\n"
+
+        strings = index.strings[name]
+        if strings:
+            yield f"  String constants: {strings[:30]}\n"
+
+
+def section_class_listing(analyzers, index):
+    """The full listing: one class at a time, nothing kept between classes."""
+    yield _banner("10. COMPLETE CLASS LISTING WITH SIGNATURES")
+
+    for name in index.names:
+        a = analyzers[name]
+        is_enum = a.is_enum()
+        yield f"\n{_kind(a)} {name.replace('/', '.')}\n"
+        if a.super_name and 'Object' not in a.super_name and 'Enum' not in a.super_name:
+            yield f"  extends {a.super_name.replace('/', '.')}\n"
+        for iface in a.interfaces:
+            yield f"  implements {iface.replace('/', '.')}\n"
+
+        for f in a.fields:
+            if not (f['access'] & 0x4000 and is_enum):  # skip enum constants in listing
+                yield _field_line(a, f, "  ")
+
+        yield from _method_lines(a, ('<clinit>', 'values', 'valueOf'), "  ")
+
+
+# Report sections by number, in report order
+REPORT_SECTIONS = {
+    '1': section_overview,
+    '2': section_command_types,
+    '3': section_entity_types,
+    '4': section_replay_parser,
+    '5': section_data_structures,
+    '6': section_utilities,
+    '7': section_generated_types,
+    '8': section_translations,
+    '9': section_info_structures,
+    '10': section_class_listing,
+}
+
+# Lines gathered before each write to the report file
+REPORT_WRITE_LINES = 4096
+
+
+def write_report(output_file, analyzers, index, sections=None):
+    """Stream the report (or only the given section numbers, in report order) to output_file.
+
+    Lines from the section generators are joined and written
+    REPORT_WRITE_LINES at a time, so memory use does not grow with the
+    size of a section.
+    """
+    numbers = list(REPORT_SECTIONS)
+    if sections is not None:
+        wanted = {str(s) for s in sections}
+        unknown = wanted.difference(REPORT_SECTIONS)
+        if unknown:
+            raise ValueError(f"Unknown report sections: {', '.join(sorted(unknown))}")
+        numbers = [n for n in numbers if n in wanted]
 
-
-def analyze_all(base_dir, output_file):
-    """Analyze all class files in the given directory."""
-    class_files = []
-    for root, dirs, files in os.walk(base_dir):
-        for f in files:
-            if f.endswith('.class'):
-                class_files.append(os.path.join(root, f))
-
-    analyzers = {}
-    for cf in sorted(class_files):
+    with open(output_file, 'w', encoding='utf-8') as out:
+        out.write(_banner("AoE4 Replay Parser - Class Analysis Report\n"
+                          f"Source: {PARSER_MODULE}@{PARSER_VERSION}"))
+        pending = []
+        for i, number in enumerate(numbers):
+            if i:
+                pending.append("\n\n")
+            for line in REPORT_SECTIONS[number](analyzers, index):
+                pending.append(line)
+                if len(pending) >= REPORT_WRITE_LINES:
+                    out.write(''.join(pending))
+                    pending.clear()
+        out.write(''.join(pending))
+
+
+def extract_int_tables(source, prefix=None):
+    """Every static int constant table of the classes in source, in one pass.
+
+    Returns {class name: [(name, value), ...]} sorted by value (ties keep
+    declaration order) for every class with static int constants
+    (ConstantValue fields) or enum constants built with an int argument,
+    e.g. the GeneratedTypeEnums. source is as for iter_class_files.
+    """
+    tables = {}
+    for cf, data in iter_class_files(source, prefix):
         try:
-            a = JavaClassAnalyzer(cf)
-            analyzers[a.class_name] = a
+            a = JavaClassAnalyzer(cf, data)
+            table = a.get_static_int_constants() + a.get_enum_constant_ids()
         except Exception as e:
             print(f"Error analyzing {cf}: {e}")
-
-    with open(output_file, 'w', encoding='utf-8') as out:
-        out.write("=" * 80 + "\n")
-        out.write("AoE4 Replay Parser - Class Analysis Report\n")
-        out.write("Source: ch.iddqd.aoe4.parser@0.9.7-SNAPSHOT\n")
-        out.write("=" * 80 + "\n\n")
-
-        # Group classes by package
-        packages = defaultdict(list)
-        for name, a in analyzers.items():
-            pkg = name.rsplit('/', 1)[0] if '/' in name else ''
-            packages[pkg].append(a)
-
-        # ================================================================
-        # 1. ARCHITECTURE OVERVIEW
-        # ================================================================
-        out.write("=" * 80 + "\n")
-        out.write("1. ARCHITECTURE OVERVIEW\n")
-        out.write("=" * 80 + "\n\n")
-
-        out.write("Packages:\n")
-        for pkg in sorted(packages.keys()):
-            classes = packages[pkg]
-            out.write(f"  {pkg.replace('/', '.')} ({len(classes)} classes)\n")
-
-        out.write("\n\nClass Hierarchy:\n")
-        for name, a in sorted(analyzers.items()):
-            kind = 'enum' if a.is_enum() else 'interface' if a.is_interface() else 'abstract class' if a.is_abstract() else 'class'
-            super_short = a.super_name.split('/')[-1] if a.super_name else ''
-            ifaces = ', '.join(i.split('/')[-1] for i in a.interfaces) if a.interfaces else ''
-            short_name = name.split('/')[-1]
-            out.write(f"  {kind} {short_name}")
-            if super_short and super_short != 'Object' and super_short != 'Enum':
-                out.write(f" extends {super_short}")
-            if ifaces:
-                out.write(f" implements {ifaces}")
-            out.write("\n")
-
-        # ================================================================
-        # 2. COMMAND TYPE MAPPINGS
-        # ================================================================
-        out.write("\n\n" + "=" * 80 + "\n")
-        out.write("2. COMMAND TYPE MAPPINGS\n")
-        out.write("=" * 80 + "\n\n")
-
-        # Look for CommandType enum
-        for name, a in analyzers.items():
-            if 'CommandType' in name and a.is_enum():
-                out.write(f"Enum: {name.replace('/', '.')}\n")
-                for f in a.fields:
-                    if f['access'] & 0x4000:  # enum constant
-                        out.write(f"  {f['name']}\n")
-                out.write("\n")
-                # Show string constants that might be command type names
-                strings = a.get_string_constants()
-                if strings:
-                    out.write(f"  String constants:\n")
-                    for s in strings:
-                        out.write(f"    \"{s}\"\n")
-                out.write("\n")
-
-        # Look for ParserProvider which maps command types to parsers
-        for name, a in analyzers.items():
-            if 'ParserProvider' in name:
-                out.write(f"\nParserProvider: {name.replace('/', '.')}\n")
-                out.write(f"  Methods:\n")
-                for m in a.methods:
-                    if m['name'] != '<init>' and m['name'] != '<clinit>':
-                        out.write(f"    {a.method_access_str(m['access'])} {m['name']}{format_method_desc(m['descriptor'])}\n")
-                strings = a.get_string_constants()
-                ints = a.get_integer_constants()
-                if ints:
-                    out.write(f"  Integer constants (possible command type IDs): {ints}\n")
-                if strings:
-                    out.write(f"  String constants:\n")
-                    for s in strings:
-                        out.write(f"    \"{s}\"\n")
-
-        # ================================================================
-        # 3. ENTITY TYPE DEFINITIONS
-        # ================================================================
-        out.write("\n\n" + "=" * 80 + "\n")
-        out.write("3. ENTITY/BUILDING/UNIT TYPE DEFINITIONS\n")
-        out.write("=" * 80 + "\n\n")
-
-        for name, a in sorted(analyzers.items()):
-            if any(x in name for x in ['EntityType', 'BuildingType', 'UnitType', 'EntityDirectory',
-                                        'EntityEntry', 'GaiaType', 'ResourceType']):
-                short = name.split('/')[-1]
-                out.write(f"\n--- {short} ---\n")
-                out.write(f"  Full name: {name.replace('/', '.')}\n")
-
-                if a.is_enum():
-                    out.write(f"  Type: enum\n")
-                    enum_fields = [f for f in a.fields if f['access'] & 0x4000]
-                    out.write(f"  Enum constants ({len(enum_fields)}):\n")
-                    for f in enum_fields:
-                        out.write(f"    {f['name']}\n")
-
-                out.write(f"  Fields:\n")
-                for f in a.fields:
-                    if not (f['access'] & 0x4000):  # skip enum constants
-                        acc = a.field_access_str(f['access'])
-                        out.write(f"    {acc} {format_descriptor(f['descriptor'])} {f['name']}\n")
-
-                out.write(f"  Methods:\n")
-                for m in a.methods:
-                    if m['name'] not in ('<init>', '<clinit>', 'values', 'valueOf'):
-                        acc = a.method_access_str(m['access'])
-                        out.write(f"    {acc} {m['name']}{format_method_desc(m['descriptor'])}\n")
-
-                # Show constant values
-                cv = a.get_constant_field_values()
-                if cv:
-                    out.write(f"  Constant values:\n")
-                    for k, v in cv.items():
-                        out.write(f"    {k} = {v}\n")
-
-                # String constants (entity names, IDs)
-                strings = a.get_string_constants()
-                if strings and len(strings) <= 50:
-                    out.write(f"  String constants ({len(strings)}):\n")
-                    for s in strings:
-                        out.write(f"    \"{s}\"\n")
-                elif strings:
-                    out.write(f"  String constants: {len(strings)} total (first 30):\n")
-                    for s in strings[:30]:
-                        out.write(f"    \"{s}\"\n")
-                    out.write(f"    ... and {len(strings)-30} more\n")
-
-                # Integer constants (type IDs)
-                ints = a.get_integer_constants()
-                if ints:
-                    out.write(f"  Integer constants ({len(ints)}): {ints[:50]}\n")
-
-        # ================================================================
-        # 4. REPLAY PARSER - Main parsing logic
-        # ================================================================
-        out.write("\n\n" + "=" * 80 + "\n")
-        out.write("4. REPLAY PARSER - Main Parsing Logic\n")
-        out.write("=" * 80 + "\n\n")
-
-        for name, a in sorted(analyzers.items()):
-            if any(x in name for x in ['ReplayParser', 'Replay', 'HeaderParser', 'CommandParser',
-                                        'MessageParser', 'MapParser', 'PlayerParser', 'SettingParser']):
-                short = name.split('/')[-1]
-                out.write(f"\n--- {short} ---\n")
-                out.write(f"  Full name: {name.replace('/', '.')}\n")
-                if a.super_name:
-                    out.write(f"  Extends: {a.super_name.replace('/', '.')}\n")
-                if a.interfaces:
-                    out.write(f"  Implements: {', '.join(i.replace('/', '.') for i in a.interfaces)}\n")
-
-                out.write(f"  Fields:\n")
-                for f in a.fields:
-                    acc = a.field_access_str(f['access'])
-                    out.write(f"    {acc} {format_descriptor(f['descriptor'])} {f['name']}\n")
-
-                out.write(f"  Methods:\n")
-                for m in a.methods:
-                    if m['name'] not in ('<clinit>',):
-                        acc = a.method_access_str(m['access'])
-                        out.write(f"    {acc} {m['name']}{format_method_desc(m['descriptor'])}\n")
-
-                ints = a.get_integer_constants()
-                if ints:
-                    out.write(f"  Integer constants: {ints}\n")
-
-                strings = a.get_string_constants()
-                if strings:
-                    out.write(f"  String constants ({len(strings)}):\n")
-                    for s in strings[:50]:
-                        out.write(f"    \"{s}\"\n")
-                    if len(strings) > 50:
-                        out.write(f"    ... and {len(strings)-50} more\n")
-
-        # ================================================================
-        # 5. DATA STRUCTURES
-        # ================================================================
-        out.write("\n\n" + "=" * 80 + "\n")
-        out.write("5. DATA STRUCTURES (Command Types, Coordinates, etc.)\n")
-        out.write("=" * 80 + "\n\n")
-
-        for name, a in sorted(analyzers.items()):
-            if any(x in name for x in ['Command', 'Coordinates', 'Building', 'Unit', 'Entity',
-                                        'Resource', 'SubCommand']):
-                if 'Parser' in name or 'Filter' in name or 'Type' in name:
-                    continue
-                short = name.split('/')[-1]
-                out.write(f"\n--- {short} ---\n")
-                out.write(f"  Full name: {name.replace('/', '.')}\n")
-                if a.super_name and 'Object' not in a.super_name:
-                    out.write(f"  Extends: {a.super_name.split('/')[-1]}\n")
-                if a.interfaces:
-                    out.write(f"  Implements: {', '.join(i.split('/')[-1] for i in a.interfaces)}\n")
-
-                out.write(f"  Fields:\n")
-                for f in a.fields:
-                    acc = a.field_access_str(f['access'])
-                    out.write(f"    {acc} {format_descriptor(f['descriptor'])} {f['name']}\n")
-
-                out.write(f"  Methods:\n")
-                for m in a.methods:
-                    if m['name'] not in ('<clinit>', '<init>', 'values', 'valueOf',
-                                         'toString', 'hashCode', 'equals'):
-                        acc = a.method_access_str(m['access'])
-                        out.write(f"    {acc} {m['name']}{format_method_desc(m['descriptor'])}\n")
-
-                strings = a.get_string_constants()
-                if strings and len(strings) <= 20:
-                    out.write(f"  String constants: {strings}\n")
-
-        # ================================================================
-        # 6. UTILITY CLASSES (LEDataInputStream, Printers)
-        # ================================================================
-        out.write("\n\n" + "=" * 80 + "\n")
-        out.write("6. UTILITY CLASSES\n")
-        out.write("=" * 80 + "\n\n")
-
-        for name, a in sorted(analyzers.items()):
-            if any(x in name for x in ['LEData', 'Printer', 'Logger', 'GameLog', 'ApmGraph']):
-                short = name.split('/')[-1]
-                out.write(f"\n--- {short} ---\n")
-                out.write(f"  Full name: {name.replace('/', '.')}\n")
-
-                out.write(f"  Methods:\n")
-                for m in a.methods:
-                    if m['name'] not in ('<clinit>', '<init>'):
-                        acc = a.method_access_str(m['access'])
-                        out.write(f"    {acc} {m['name']}{format_method_desc(m['descriptor'])}\n")
-
-        # ================================================================
-        # 7. GENERATED TYPE ENUMS (Entity ID Mappings)
-        # ================================================================
-        out.write("\n\n" + "=" * 80 + "\n")
-        out.write("7. GENERATED TYPE ENUMS (Entity ID Mappings)\n")
-        out.write("=" * 80 + "\n\n")
-
-        for name, a in sorted(analyzers.items()):
-            if 'GeneratedType' in name and a.is_enum():
-                short = name.split('/')[-1]
-                enum_fields = [f for f in a.fields if f['access'] & 0x4000]
-                out.write(f"\n--- {short} ({len(enum_fields)} entries) ---\n")
-
-                # Show first 50 enum constants
-                for f in enum_fields[:50]:
-                    out.write(f"  {f['name']}\n")
-                if len(enum_fields) > 50:
-                    out.write(f"  ... and {len(enum_fields)-50} more\n")
-
-                # Show non-enum fields (which might include ID mappings)
-                non_enum_fields = [f for f in a.fields if not (f['access'] & 0x4000)]
-                if non_enum_fields:
-                    out.write(f"  Non-enum fields:\n")
-                    for f in non_enum_fields:
-                        acc = a.field_access_str(f['access'])
-                        out.write(f"    {acc} {format_descriptor(f['descriptor'])} {f['name']}\n")
-
-                # Integer constants are the actual type IDs
-                ints = a.get_integer_constants()
-                if ints:
-                    out.write(f"  Integer constants ({len(ints)} values, first 50): {ints[:50]}\n")
-
-                strings = a.get_string_constants()
-                if strings:
-                    out.write(f"  String constants ({len(strings)}, first 20): {strings[:20]}\n")
-
-        # ================================================================
-        # 8. TRANSLATIONS & MAP INFO
-        # ================================================================
-        out.write("\n\n" + "=" * 80 + "\n")
-        out.write("8. TRANSLATIONS, MAP INFO & GAME LOG\n")
-        out.write("=" * 80 + "\n\n")
-
-        for name, a in sorted(analyzers.items()):
-            if any(x in name for x in ['Translations', 'MapInfo', 'MapInitializer',
-                                        'GameLog', 'Actions', 'Age']):
-                short = name.split('/')[-1]
-                out.write(f"\n--- {short} ---\n")
-                out.write(f"  Full name: {name.replace('/', '.')}\n")
-
-                if a.is_enum():
-                    enum_fields = [f for f in a.fields if f['access'] & 0x4000]
-                    out.write(f"  Enum constants: {[f['name'] for f in enum_fields]}\n")
-
-                non_enum_fields = [f for f in a.fields if not (f['access'] & 0x4000)]
-                if non_enum_fields:
-                    out.write(f"  Fields:\n")
-                    for f in non_enum_fields:
-                        acc = a.field_access_str(f['access'])
-                        out.write(f"    {acc} {format_descriptor(f['descriptor'])} {f['name']}\n")
-
-                out.write(f"  Methods:\n")
-                for m in a.methods:
-                    if m['name'] not in ('<clinit>', '<init>', 'values', 'valueOf'):
-                        acc = a.method_access_str(m['access'])
-                        out.write(f"    {acc} {m['name']}{format_method_desc(m['descriptor'])}\n")
-
-                strings = a.get_string_constants()
-                if strings and len(strings) <= 30:
-                    out.write(f"  String constants: {strings}\n")
-                elif strings:
-                    out.write(f"  String constants ({len(strings)}, first 30): {strings[:30]}\n")
-
-        # ================================================================
-        # 9. HEADER / INFO STRUCTURES
-        # ================================================================
-        out.write("\n\n" + "=" * 80 + "\n")
-        out.write("9. HEADER & INFO STRUCTURES\n")
-        out.write("=" * 80 + "\n\n")
-
-        for name, a in sorted(analyzers.items()):
-            if any(x in name for x in ['Header', 'Player', 'Setting', 'Color', 'CustomMap',
-                                        'Map']) and 'Parser' not in name and 'Type' not in name:
-                if name in analyzers and not any(x in name for x in ['Command']):
-                    short = name.split('/')[-1]
-                    out.write(f"\n--- {short} ---\n")
-                    out.write(f"  Full name: {name.replace('/', '.')}\n")
-
-                    out.write(f"  Fields:\n")
-                    for f in a.fields:
-                        acc = a.field_access_str(f['access'])
-                        out.write(f"    {acc} {format_descriptor(f['descriptor'])} {f['name']}\n")
-
-                    out.write(f"  Methods:\n")
-                    for m in a.methods:
-                        if m['name'] not in ('<clinit>',):
-                            acc = a.method_access_str(m['access'])
-                            out.write(f"    {acc} {m['name']}{format_method_desc(m['descriptor'])}\n")
-
-                    cv = a.get_constant_field_values()
-                    if cv:
-                        out.write(f"  Constant values: {cv}\n")
-
-                    strings = a.get_string_constants()
-                    if strings:
-                        out.write(f"  String constants: {strings[:30]}\n")
-
-        # ================================================================
-        # 10. COMPLETE CLASS LISTING
-        # ================================================================
-        out.write("\n\n" + "=" * 80 + "\n")
-        out.write("10. COMPLETE CLASS LISTING WITH SIGNATURES\n")
-        out.write("=" * 80 + "\n\n")
-
-        for name, a in sorted(analyzers.items()):
-            short = name.split('/')[-1]
-            kind = 'enum' if a.is_enum() else 'interface' if a.is_interface() else 'abstract class' if a.is_abstract() else 'class'
-            out.write(f"\n{kind} {name.replace('/', '.')}\n")
-            if a.super_name and 'Object' not in a.super_name and 'Enum' not in a.super_name:
-                out.write(f"  extends {a.super_name.replace('/', '.')}\n")
-            for iface in a.interfaces:
-                out.write(f"  implements {iface.replace('/', '.')}\n")
-
-            for f in a.fields:
-                if not (f['access'] & 0x4000 and a.is_enum()):  # skip enum constants in listing
-                    acc = a.field_access_str(f['access'])
-                    out.write(f"  {acc} {format_descriptor(f['descriptor'])} {f['name']}\n")
-
-            for m in a.methods:
-                if m['name'] not in ('<clinit>', 'values', 'valueOf'):
-                    acc = a.method_access_str(m['access'])
-                    out.write(f"  {acc} {m['name']}{format_method_desc(m['descriptor'])}\n")
-
+            continue
+        if table:
+            table.sort(key=lambda item: item[1])
+            tables[a.class_name] = table
+    return tables
+
+
+def load_analyzers(base_dir, prefix=None, jobs=1, cache=None):
+    """Parse every class of base_dir; return (analyzers by class name, ClassIndex).
+
+    jobs and cache are as for analyze_all; classes that fail to parse are
+    reported and left out.
+    """
+    items = iter_class_files(base_dir, prefix)
+    if cache is not None:
+        results = _cached_summaries(items, cache, jobs)
+    else:
+        results = _analyze_items(items, jobs)
+    analyzers = {}
+    for cf, a, error in results:
+        if error is not None:
+            print(f"Error analyzing {cf}: {error}")
+            continue
+        analyzers[a.class_name] = a
+    return analyzers, ClassIndex(analyzers)
+
+
+def analyze_all(base_dir, output_file, prefix=None, jobs=1, cache=None, sections=None):
+    """Analyze all class files in the given directory, archive or image.
+
+    With jobs > 1 the classes are parsed in a process pool and come back
+    as ClassSummary objects, in the same order, so the report is identical
+    to the serial one. cache is the path of a class cache file: classes
+    whose content is already in it are not parsed again. sections limits
+    the report to those section numbers (see REPORT_SECTIONS).
+    """
+    analyzers, index = load_analyzers(base_dir, prefix, jobs, cache)
+    write_report(output_file, analyzers, index, sections)
     print(f"Analysis written to: {output_file}")
 
 
 def main():
-    base_dir = "C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted/ch.iddqd.aoe4.parser"
-    output_file = "C:/Users/fermi/aoe4-replay-viewer/tools/parser_analysis.txt"
-
-    analyze_all(base_dir, output_file)
+    default_report = "C:/Users/fermi/aoe4-replay-viewer/tools/parser_analysis.txt"
+    ap = argparse.ArgumentParser(description="Write the class analysis report of the extracted parser module.")
+    ap.add_argument('source', nargs='?',
+                    default="C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted/ch.iddqd.aoe4.parser",
+                    help="directory of .class files, a .zip/.tar from extract_jimage --archive, "
+                         "or a JIMAGE (lib/modules) to analyze without extracting")
+    ap.add_argument('output_file', nargs='?',
+                    help=f"report file (default: {default_report}; required with --section)")
+    ap.add_argument('--prefix',
+                    help="only analyze archive or image classes under this path "
+                         "(e.g. ch.iddqd.aoe4.parser/)")
+    ap.add_argument('--jobs', '-j', type=int, default=1,
+                    help="parse classes in this many processes (default: 1)")
+    ap.add_argument('--cache',
+                    help="class cache file (default: output_file + '.cache')")
+    ap.add_argument('--no-cache', action='store_true',
+                    help="parse every class and do not read or write the class cache")
+    ap.add_argument('--section', action='append', choices=list(REPORT_SECTIONS),
+                    help="only write this report section (repeatable) to output_file, "
+                         "which is replaced by just those sections")
+    args = ap.parse_args()
+    if args.output_file is None:
+        if args.section:
+            ap.error("--section needs an explicit output_file; "
+                     "it would replace the full report with only those sections")
+        args.output_file = default_report
+
+    cache = None if args.no_cache else args.cache or args.output_file + '.cache'
+    analyze_all(args.source, args.output_file, prefix=args.prefix, jobs=args.jobs, cache=cache,
+                sections=args.section)
 
 
 if __name__ == '__main__':
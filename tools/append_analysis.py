@@ -1,116 +1,54 @@
-"""Append ID mappings and architecture summary to parser_analysis.txt"""
-import struct, os
-
-base_dir = 'C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted/ch.iddqd.aoe4.parser'
-output_file = 'C:/Users/fermi/aoe4-replay-viewer/tools/parser_analysis.txt'
-
-def get_static_int_fields(filepath):
-    with open(filepath, 'rb') as f:
-        data = f.read()
-    pos = 8
-    cp_count = struct.unpack_from('>H', data, pos)[0]; pos += 2
-    cp = [None]
-    i = 1
-    while i < cp_count:
-        tag = data[pos]; pos += 1
-        if tag == 1:
-            ln = struct.unpack_from('>H', data, pos)[0]; pos += 2
-            s = data[pos:pos+ln].decode('utf-8', errors='replace'); pos += ln
-            cp.append(('UTF8', s))
-        elif tag == 3:
-            val = struct.unpack_from('>i', data, pos)[0]; pos += 4
-            cp.append(('Integer', val))
-        elif tag == 4: pos += 4; cp.append(None)
-        elif tag == 5: pos += 8; cp.append(None); i += 1; cp.append(None)
-        elif tag == 6: pos += 8; cp.append(None); i += 1; cp.append(None)
-        elif tag == 7: pos += 2; cp.append(('Class',))
-        elif tag == 8: pos += 2; cp.append(('String',))
-        elif tag in (9,10,11): pos += 4; cp.append(('Ref',))
-        elif tag == 12: pos += 4; cp.append(('NAT',))
-        elif tag == 15: pos += 3; cp.append(None)
-        elif tag == 16: pos += 2; cp.append(None)
-        elif tag in (17,18): pos += 4; cp.append(None)
-        elif tag in (19,20): pos += 2; cp.append(None)
-        else: break
-        i += 1
-    pos += 6
-    iface_count = struct.unpack_from('>H', data, pos)[0]; pos += 2
-    pos += iface_count * 2
-    fields_count = struct.unpack_from('>H', data, pos)[0]; pos += 2
-    results = {}
-    for _ in range(fields_count):
-        facc = struct.unpack_from('>H', data, pos)[0]; pos += 2
-        fname_idx = struct.unpack_from('>H', data, pos)[0]; pos += 2
-        fdesc_idx = struct.unpack_from('>H', data, pos)[0]; pos += 2
-        fname = cp[fname_idx][1] if cp[fname_idx] and cp[fname_idx][0] == 'UTF8' else '?'
-        fdesc = cp[fdesc_idx][1] if cp[fdesc_idx] and cp[fdesc_idx][0] == 'UTF8' else '?'
-        fattrs_count = struct.unpack_from('>H', data, pos)[0]; pos += 2
-        for _ in range(fattrs_count):
-            aname_idx = struct.unpack_from('>H', data, pos)[0]; pos += 2
-            alen = struct.unpack_from('>I', data, pos)[0]; pos += 4
-            aname = cp[aname_idx][1] if cp[aname_idx] and cp[aname_idx][0] == 'UTF8' else '?'
-            if aname == 'ConstantValue' and fdesc == 'I':
-                cv_idx = struct.unpack_from('>H', data, pos)[0]
-                if cv_idx < len(cp) and cp[cv_idx] and cp[cv_idx][0] == 'Integer':
-                    results[fname] = cp[cv_idx][1]
-            pos += alen
-    return results
-
-with open(output_file, 'a', encoding='utf-8') as out:
-    out.write('\n\n')
-    out.write('=' * 80 + '\n')
-    out.write('APPENDIX A: COMMAND TYPE ID -> NAME MAPPINGS\n')
-    out.write('=' * 80 + '\n\n')
-    out.write('These are the integer command type IDs used in the replay binary format.\n')
-    out.write('The ParserProvider.getParser(int) method maps these IDs to specific parsers.\n\n')
-
-    ct = get_static_int_fields(os.path.join(base_dir, 'ch/iddqd/aoe4/parser/commandCommandType.class'))
-    for name, val in sorted(ct.items(), key=lambda x: x[1]):
-        out.write(f'  {val:>6} (0x{val & 0xFF:02X}) = {name}\n')
-
-    out.write('\n\n')
-    out.write('=' * 80 + '\n')
-    out.write('APPENDIX B: ACTION TYPE ID MAPPINGS\n')
-    out.write('=' * 80 + '\n\n')
-
-    at = get_static_int_fields(os.path.join(base_dir, 'ch/iddqd/aoe4/parser/typeActionType.class'))
-    for name, val in sorted(at.items(), key=lambda x: x[1]):
-        out.write(f'  {val:>8} (0x{val & 0xFFFF:04X}) = {name}\n')
-
-    out.write('\n\n')
-    out.write('=' * 80 + '\n')
-    bt = get_static_int_fields(os.path.join(base_dir, 'ch/iddqd/aoe4/parser/typeBuildingType.class'))
-    out.write(f'APPENDIX C: BUILDING TYPE ID MAPPINGS (all {len(bt)} entries)\n')
-    out.write('=' * 80 + '\n\n')
-
-    for name, val in sorted(bt.items(), key=lambda x: x[1]):
-        out.write(f'  {val:>8} (0x{val & 0xFFFF:04X}) = {name}\n')
-
-    out.write('\n\n')
-    out.write('=' * 80 + '\n')
-    out.write('APPENDIX D: UNIT TYPE ID MAPPINGS\n')
-    out.write('=' * 80 + '\n\n')
-
-    ut = get_static_int_fields(os.path.join(base_dir, 'ch/iddqd/aoe4/parser/typeUnitType.class'))
-    for name, val in sorted(ut.items(), key=lambda x: x[1]):
-        out.write(f'  {val:>8} (0x{val & 0xFFFF:04X}) = {name}\n')
-
-    out.write('\n\n')
-    out.write('=' * 80 + '\n')
-    upt = get_static_int_fields(os.path.join(base_dir, 'ch/iddqd/aoe4/parser/typeUpgradeType.class'))
-    out.write(f'APPENDIX E: UPGRADE TYPE ID MAPPINGS (all {len(upt)} entries)\n')
-    out.write('=' * 80 + '\n\n')
-
-    for name, val in sorted(upt.items(), key=lambda x: x[1]):
-        out.write(f'  {val:>8} (0x{val & 0xFFFF:04X}) = {name}\n')
-
-    # Architecture summary
-    out.write('\n\n')
-    out.write('=' * 80 + '\n')
-    out.write('APPENDIX F: PARSER ARCHITECTURE SUMMARY\n')
-    out.write('=' * 80 + '\n\n')
+"""
+Append ID mappings and architecture summary to parser_analysis.txt
+
+The ID tables come from analyze_classes.extract_int_tables, one pass over
+the extracted parser module: the static int constants of CommandType,
+ActionType, BuildingType, UnitType and UpgradeType, and the int ids of the
+Building/Unit/Upgrade/Ability GeneratedTypeEnums. The appendices are
+rebuilt on every run: everything from the first APPENDIX heading of the
+report on is replaced, so running it again does not duplicate them.
+"""
 
-    summary = """
+import argparse
+import os
+
+from analyze_classes import extract_int_tables
+
+# Where the appendices start in the report
+APPENDIX_MARKER = '\n\n' + '=' * 80 + '\nAPPENDIX '
+
+COMMAND_TYPE_INTRO = (
+    'These are the integer command type IDs used in the replay binary format.\n'
+    'The ParserProvider.getParser(int) method maps these IDs to specific parsers.\n\n')
+
+# (class, appendix title, intro, line format) of each ID table, in order;
+# {n} in a title is the number of entries
+ID_APPENDICES = (
+    ('ch/iddqd/aoe4/parser/command/CommandType', 'COMMAND TYPE ID -> NAME MAPPINGS',
+     COMMAND_TYPE_INTRO, '  {val:>6} (0x{low8:02X}) = {name}\n'),
+    ('ch/iddqd/aoe4/parser/type/ActionType', 'ACTION TYPE ID MAPPINGS',
+     '', '  {val:>8} (0x{low16:04X}) = {name}\n'),
+    ('ch/iddqd/aoe4/parser/type/BuildingType', 'BUILDING TYPE ID MAPPINGS (all {n} entries)',
+     '', '  {val:>8} (0x{low16:04X}) = {name}\n'),
+    ('ch/iddqd/aoe4/parser/type/UnitType', 'UNIT TYPE ID MAPPINGS',
+     '', '  {val:>8} (0x{low16:04X}) = {name}\n'),
+    ('ch/iddqd/aoe4/parser/type/UpgradeType', 'UPGRADE TYPE ID MAPPINGS (all {n} entries)',
+     '', '  {val:>8} (0x{low16:04X}) = {name}\n'),
+    ('ch/iddqd/aoe4/parser/type/BuildingGeneratedTypeEnum',
+     'BUILDING GENERATED TYPE ENUM ID MAPPINGS (all {n} entries)',
+     '', '  {val:>8} (0x{low16:04X}) = {name}\n'),
+    ('ch/iddqd/aoe4/parser/type/UnitGeneratedTypeEnum',
+     'UNIT GENERATED TYPE ENUM ID MAPPINGS (all {n} entries)',
+     '', '  {val:>8} (0x{low16:04X}) = {name}\n'),
+    ('ch/iddqd/aoe4/parser/type/UpgradeGeneratedTypeEnum',
+     'UPGRADE GENERATED TYPE ENUM ID MAPPINGS (all {n} entries)',
+     '', '  {val:>8} (0x{low16:04X}) = {name}\n'),
+    ('ch/iddqd/aoe4/parser/type/AbilityGeneratedTypeEnum',
+     'ABILITY GENERATED TYPE ENUM ID MAPPINGS (all {n} entries)',
+     '', '  {val:>8} (0x{low16:04X}) = {name}\n'),
+)
+
+SUMMARY = """
 REPLAY FILE FORMAT SUMMARY
 ===========================
 
@@ -221,6 +159,66 @@ REPLAY FILE FORMAT SUMMARY
      5. Build GameLog, ApmGraph, EntityDirectory from commands
      6. Apply CommandFilter for filtered view
 """
-    out.write(summary)
 
-print('Appendices and summary added to parser_analysis.txt')
+
+def appendices(tables):
+    """The appendix text for tables ({class name: [(name, value)]} sorted by value)."""
+    parts = []
+    letter = ord('A')
+    for class_name, title, intro, line in ID_APPENDICES:
+        table = tables.get(class_name)
+        if table is None:
+            print(f"Not found, skipped: {class_name}")
+            continue
+        parts.append('\n\n' + '=' * 80 + '\n')
+        parts.append(f"APPENDIX {chr(letter)}: {title.format(n=len(table))}\n")
+        parts.append('=' * 80 + '\n\n')
+        parts.append(intro)
+        for name, val in table:
+            parts.append(line.format(val=val, low8=val & 0xFF, low16=val & 0xFFFF, name=name))
+        letter += 1
+
+    # Architecture summary
+    parts.append('\n\n' + '=' * 80 + '\n')
+    parts.append(f"APPENDIX {chr(letter)}: PARSER ARCHITECTURE SUMMARY\n")
+    parts.append('=' * 80 + '\n\n')
+    parts.append(SUMMARY)
+    return ''.join(parts)
+
+
+def write_appendices(report_path, tables):
+    """Replace the appendices of the report at report_path (atomically)."""
+    try:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = f.read()
+    except FileNotFoundError:
+        report = ''
+    cut = report.find(APPENDIX_MARKER)
+    if cut >= 0:
+        report = report[:cut]
+    tmp_path = f"{report_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as out:
+        out.write(report)
+        out.write(appendices(tables))
+    os.replace(tmp_path, report_path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Append the ID mapping appendices to the class analysis report.")
+    ap.add_argument('source', nargs='?',
+                    default='C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted/ch.iddqd.aoe4.parser',
+                    help="directory of .class files, a .zip/.tar from extract_jimage --archive, "
+                         "or a JIMAGE (lib/modules)")
+    ap.add_argument('report', nargs='?',
+                    default='C:/Users/fermi/aoe4-replay-viewer/tools/parser_analysis.txt')
+    ap.add_argument('--prefix',
+                    help="only read archive or image classes under this path "
+                         "(e.g. ch.iddqd.aoe4.parser/)")
+    args = ap.parse_args()
+
+    write_appendices(args.report, extract_int_tables(args.source, args.prefix))
+    print(f'Appendices and summary written to {args.report}')
+
+
+if __name__ == '__main__':
+    main()
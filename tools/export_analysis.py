@@ -0,0 +1,216 @@
+"""
+Machine-readable export of the parser analysis.
+
+Writes what analyze_classes learns about the parser module as a compact
+JSON file plus a binary sidecar next to it (same name, .bin), so the
+server can load IDs instead of copying them out of parser_analysis.txt.
+
+The JSON holds every name; every number array lives in the sidecar and
+is referenced as {"offset": bytes from the start of the file, "count":
+n}. Arrays are little-endian int32, 4-byte aligned, after a 16-byte
+header (magic b'AOE4ANL\\0', format version, payload size):
+
+  classes        names (sorted, dotted); access_flags and super (index
+                 into names, -1 if outside the module) per class
+  enums          per enum class: constants in ordinal order, and the
+                 constants built with an int id (e.g. the
+                 GeneratedTypeEnums): names and ids, sorted by id
+  constants      per class with static int constants: names and values,
+                 sorted by value
+  command_types  the CommandType table of constants (IDs sorted)
+
+The JSON also records the module, its version and the size and blake2b
+digest of the sidecar, so a stale pair is detected on load.
+
+Usage:
+  python export_analysis.py                      # extracted parser module
+  python export_analysis.py lib/modules parser_analysis.json --prefix ch.iddqd.aoe4.parser/
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+
+from analyze_classes import PARSER_MODULE, PARSER_VERSION, load_analyzers
+
+EXPORT_FORMAT = 2
+SIDECAR_MAGIC = b'AOE4ANL\x00'
+SIDECAR_HEADER = struct.Struct('<8sII')
+
+# Integer field descriptors whose ConstantValue is an int32
+INT_DESCRIPTORS = ('I', 'S', 'B')
+
+
+class Sidecar:
+    """Collects int32 arrays and hands out their JSON references."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = SIDECAR_HEADER.size
+
+    def add(self, values):
+        column = array('i', values)
+        if sys.byteorder != 'little':
+            column.byteswap()
+        ref = {'offset': self.size, 'count': len(column)}
+        self.parts.append(column.tobytes())
+        self.size += len(self.parts[-1])
+        return ref
+
+    def to_bytes(self):
+        payload = b''.join(self.parts)
+        return SIDECAR_HEADER.pack(SIDECAR_MAGIC, EXPORT_FORMAT, len(payload)) + payload
+
+
+def _by_value(table):
+    return sorted(table, key=lambda item: (item[1], item[0]))
+
+
+def int_constants(a, constant_values):
+    """(name, value) of the int constants of a class, sorted by value then name."""
+    return _by_value((f['name'], constant_values[f['name']]) for f in a.fields
+                     if f['descriptor'] in INT_DESCRIPTORS and f['name'] in constant_values)
+
+
+def build_export(analyzers, index, sidecar_name):
+    """Return (export dict, sidecar bytes) for the analyzed classes."""
+    sidecar = Sidecar()
+    names = index.names
+    ids = {name: i for i, name in enumerate(names)}
+
+    export = {
+        'format': EXPORT_FORMAT,
+        'module': PARSER_MODULE,
+        'version': PARSER_VERSION,
+        'sidecar': None,
+        'classes': {
+            'names': [name.replace('/', '.') for name in names],
+            'access_flags': sidecar.add(analyzers[name].access_flags for name in names),
+            'super': sidecar.add(ids.get(analyzers[name].super_name, -1) for name in names),
+        },
+        'enums': {},
+        'constants': {},
+        'command_types': None,
+    }
+
+    for name in names:
+        a = analyzers[name]
+        dotted = name.replace('/', '.')
+        if a.is_enum():
+            enum_ids = _by_value(a.get_enum_constant_ids())
+            export['enums'][dotted] = {
+                'constants': [f['name'] for f in a.fields if f['access'] & 0x4000],
+                'ids': {'names': [n for n, _ in enum_ids],
+                        'values': sidecar.add(v for _, v in enum_ids)},
+            }
+        table = int_constants(a, index.constant_values[name])
+        if table:
+            export['constants'][dotted] = {
+                'names': [n for n, _ in table],
+                'values': sidecar.add(v for _, v in table),
+            }
+
+    for name in index.keyword('CommandType'):
+        dotted = name.replace('/', '.')
+        if name.rsplit('/', 1)[-1] == 'CommandType' and dotted in export['constants']:
+            export['command_types'] = {'class': dotted, **export['constants'][dotted]}
+            break
+
+    blob = sidecar.to_bytes()
+    export['sidecar'] = {'file': sidecar_name, 'size': len(blob),
+                         'blake2b': hashlib.blake2b(blob, digest_size=16).hexdigest()}
+    return export, blob
+
+
+def sidecar_path(json_path):
+    return os.path.splitext(json_path)[0] + '.bin'
+
+
+def _replace(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_export(json_path, analyzers, index):
+    """Write the JSON export and its sidecar; return the export dict.
+
+    Both files are replaced atomically, sidecar first; the output only
+    depends on the classes, so unchanged input rewrites identical files.
+    """
+    bin_path = sidecar_path(json_path)
+    export, blob = build_export(analyzers, index, os.path.basename(bin_path))
+    os.makedirs(os.path.dirname(os.path.abspath(json_path)), exist_ok=True)
+    _replace(bin_path, blob)
+    _replace(json_path, json.dumps(export, ensure_ascii=False,
+                                   separators=(',', ':')).encode('utf-8'))
+    return export
+
+
+def read_export(json_path):
+    """Load an export, with every sidecar reference replaced by its array('i').
+
+    Raises ValueError if the sidecar is missing, stale or corrupt.
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        export = json.load(f)
+    if export.get('format') != EXPORT_FORMAT:
+        raise ValueError(f"{json_path}: unsupported export format {export.get('format')}")
+    with open(os.path.join(os.path.dirname(json_path), export['sidecar']['file']), 'rb') as f:
+        blob = f.read()
+    if len(blob) != export['sidecar']['size'] or \
+            hashlib.blake2b(blob, digest_size=16).hexdigest() != export['sidecar']['blake2b']:
+        raise ValueError(f"{json_path}: sidecar does not match the export")
+    magic, version, payload_size = SIDECAR_HEADER.unpack_from(blob, 0)
+    if magic != SIDECAR_MAGIC or version != EXPORT_FORMAT or \
+            payload_size != len(blob) - SIDECAR_HEADER.size:
+        raise ValueError(f"{json_path}: bad sidecar header")
+
+    def resolve(node):
+        if isinstance(node, dict):
+            if node.keys() == {'offset', 'count'}:
+                column = array('i')
+                column.frombytes(blob[node['offset']:node['offset'] + 4 * node['count']])
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                return column
+            return {k: resolve(v) for k, v in node.items()}
+        return node
+    return resolve(export)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Export the parser analysis as JSON plus a binary ID sidecar.")
+    ap.add_argument('source', nargs='?',
+                    default="C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted/ch.iddqd.aoe4.parser",
+                    help="directory of .class files, a .zip/.tar from extract_jimage --archive, "
+                         "or a JIMAGE (lib/modules)")
+    ap.add_argument('output_file', nargs='?',
+                    default="C:/Users/fermi/aoe4-replay-viewer/tools/parser_analysis.json")
+    ap.add_argument('--prefix',
+                    help="only export archive or image classes under this path "
+                         "(e.g. ch.iddqd.aoe4.parser/)")
+    ap.add_argument('--jobs', '-j', type=int, default=1,
+                    help="parse classes in this many processes (default: 1)")
+    ap.add_argument('--cache',
+                    help="class cache file (default: output_file + '.cache')")
+    ap.add_argument('--no-cache', action='store_true',
+                    help="parse every class and do not read or write the class cache")
+    args = ap.parse_args()
+
+    cache = None if args.no_cache else args.cache or args.output_file + '.cache'
+    analyzers, index = load_analyzers(args.source, args.prefix, args.jobs, cache)
+    export = write_export(args.output_file, analyzers, index)
+    print(f"{len(export['classes']['names'])} classes, {len(export['enums'])} enums, "
+          f"{len(export['constants'])} constant tables")
+    print(f"Export written to: {args.output_file} (+ {export['sidecar']['file']}, "
+          f"{export['sidecar']['size']} bytes)")
+
+
+if __name__ == '__main__':
+    main()
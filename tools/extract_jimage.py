@@ -1,6 +1,9 @@
 """
 Extract classes from JIMAGE format used by Java 9+ runtime images.
 
+Locations are decoded by jimage_parser.decode_attributes, shared with
+JImageParser.
+
 JIMAGE Location attribute encoding (from OpenJDK ImageLocation.java):
   - Each attribute starts with a header byte
   - If byte <= 7: END marker, stop parsing
@@ -21,23 +24,136 @@ Attribute kinds:
   7 = UNCOMPRESSED (uncompressed size)
 """
 
+import argparse
+import hashlib
+import json
+import io
+import mmap
 import struct
 import os
 import sys
+import tarfile
+import time
+import zipfile
 import zlib
 from collections import Counter
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from jimage_parser import (ATTRIBUTE_BASE, ATTRIBUTE_COMPRESSED, ATTRIBUTE_EXTENSION,
+                           ATTRIBUTE_MODULE, ATTRIBUTE_OFFSET, ATTRIBUTE_PARENT,
+                           ATTRIBUTE_UNCOMPRESSED, JImageHeader, JImageParser,
+                           atomic_open, build_full_name, load_location_table, make_output_dirs,
+                           write_file)
+
+
+class StringTable:
+    """The JIMAGE string table: NUL-terminated strings addressed by offset."""
+
+    def __init__(self, string_data):
+        self.string_data = string_data
+
+    def get_string_bytes(self, offset):
+        """Raw (modified UTF-8) bytes of the string at offset, without the NUL."""
+        if offset < 0 or offset >= len(self.string_data):
+            return None
+        end = self.string_data.index(b'\x00', offset)
+        return self.string_data[offset:end]
+
+    def get_string(self, offset):
+        raw = self.get_string_bytes(offset)
+        if raw is None:
+            return None
+        return raw.decode('utf-8', errors='replace')
+
+
+class LocationIndex(StringTable):
+    """Structure-of-arrays view of every location in a JIMAGE.
+
+    Each attribute lives in its own typed array (one slot per resource):
+    module/parent/base/extension hold string-table offsets, the other
+    columns hold content offsets and sizes. Strings are only decoded when
+    a caller asks for them, e.g. through entry().
+    """
+
+    def __init__(self, columns, string_data):
+        (self.module, self.parent, self.base, self.extension,
+         self.content_offset, self.compressed_size, self.uncompressed_size) = columns
+        super().__init__(string_data)
+
+    def __len__(self):
+        return len(self.module)
+
+    def module_counts(self):
+        """Count entries per module name, decoding each module string once."""
+        return Counter({self.get_string(off) or '': n
+                        for off, n in Counter(self.module).items()})
+
+    def _offsets_matching(self, column, names):
+        """Distinct string offsets in column whose string is one of names."""
+        return {off for off in set(column) if (self.get_string(off) or '') in names}
 
+    def rows_for_module(self, module_name):
+        """Row numbers of all entries that belong to module_name."""
+        wanted = self._offsets_matching(self.module, {module_name})
+        return [i for i, off in enumerate(self.module) if off in wanted]
 
-def read_jimage(filepath):
+    def iter_entries(self, modules=None, extensions=None):
+        """Lazily yield entry dicts, optionally restricted to modules/extensions.
+
+        Filters compare string offsets; only the rows that pass are turned
+        into dicts, so callers can stop early without paying for the rest.
+        """
+        module_offs = self._offsets_matching(self.module, set(modules)) if modules else None
+        ext_offs = self._offsets_matching(self.extension, set(extensions)) if extensions else None
+        for i in range(len(self)):
+            if module_offs is not None and self.module[i] not in module_offs:
+                continue
+            if ext_offs is not None and self.extension[i] not in ext_offs:
+                continue
+            yield self.entry(i)
+
+    def entry(self, i):
+        """Materialize row i as the entry dict used by extract_resource."""
+        module = self.get_string(self.module[i]) or ''
+        parent = self.get_string(self.parent[i]) or ''
+        base = self.get_string(self.base[i]) or ''
+        ext = self.get_string(self.extension[i]) or ''
+
+        return {
+            'module': module,
+            'parent': parent,
+            'base': base,
+            'extension': ext,
+            'full_path': build_full_name(module, parent, base, ext),
+            'content_offset': self.content_offset[i],
+            'compressed_size': self.compressed_size[i],
+            'uncompressed_size': self.uncompressed_size[i],
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.entry(i)
+
+
+def read_jimage(filepath, use_cache=True, cache_dir=None):
+    """Read a JIMAGE and its location index.
+
+    The decoded location table is cached on disk (next to the image, or in
+    cache_dir) and reused while the image's size, mtime and header match.
+    """
     with open(filepath, 'rb') as f:
         data = f.read()
 
-    # Parse header (7 uint32 values, little-endian)
-    endian = '<'
+    # Parse header (7 uint32 values, in the byte order the magic gives)
+    endian = JImageHeader(data).endian
     magic, version, flags, resource_count, table_length, locations_size, strings_size = \
         struct.unpack_from(endian + '7I', data, 0)
-
-    assert magic == 0xCAFEDADA, f"Not a JIMAGE file: magic=0x{magic:08X}"
     print(f"JIMAGE: magic=0x{magic:08X}, version={version>>16}.{version&0xFFFF}")
     print(f"Resources: {resource_count}, Table: {table_length}")
     print(f"Locations: {locations_size} bytes, Strings: {strings_size} bytes")
@@ -57,139 +173,693 @@ def read_jimage(filepath):
     # String table
     string_data = data[strings_off:strings_off + strings_size]
 
-    def get_string(offset):
-        if offset < 0 or offset >= strings_size:
-            return None
-        end = string_data.index(b'\x00', offset)
-        return string_data[offset:end].decode('utf-8', errors='replace')
-
-    # Location decoder with CORRECTED attribute encoding
-    def decode_location(loc_offset):
-        """Decode location attributes from the locations section.
-
-        Key insight: count = (byte & 7) + 1, NOT (byte & 7)!
-        The +1 means there is ALWAYS at least 1 data byte per attribute.
-        """
-        attrs = [0] * 8  # ATTRIBUTE_COUNT = 8
-        pos = locations_off + loc_offset
-
-        while pos < locations_off + locations_size:
-            b = data[pos]
-            pos += 1
-
-            if b <= 7:  # END
-                break
-
-            kind = (b >> 3) & 0xFF  # unsigned right shift
-            count = (b & 7) + 1     # KEY: +1 means minimum 1 byte
+    # Decode all locations into a columnar index (or load it from the cache)
+    header_fields = (magic, version, flags, resource_count, table_length,
+                     locations_size, strings_size)
+    columns = load_location_table(filepath, data, header_fields, offsets_off, locations_off,
+                                  endian, use_cache=use_cache, cache_dir=cache_dir)
+    index = LocationIndex(columns, string_data)
+
+    return index, data, resources_off
+
+
+def image_location_index(image, use_cache=True, cache_dir=None):
+    """LocationIndex of an open JImageParser, from its (cached) location columns."""
+    columns = image.load_index(cache_dir=cache_dir, use_cache=use_cache)
+    return LocationIndex(columns, bytes(image.data[image.strings_offset:
+                                                   image.strings_offset + image.strings_size]))
+
+
+def location_entry(entry):
+    """Convert a JImageParser entry into the dict extract_resource expects."""
+    return {
+        'module': entry['module'],
+        'parent': entry['parent'],
+        'base': entry['base'],
+        'extension': entry['extension'],
+        'full_path': entry['full_path'],
+        'content_offset': entry['offset'],
+        'compressed_size': entry['compressed_size'],
+        'uncompressed_size': entry['uncompressed_size'],
+    }
 
-            if kind > 7:
-                # Invalid kind, skip this entry
-                return None
 
-            # Read 'count' bytes as big-endian value
-            value = 0
-            for j in range(count):
-                if pos < len(data):
-                    value = (value << 8) | data[pos]
-                    pos += 1
+# CompressedResourceHeader (jdk.internal.jimage.decompressor):
+#   uint32 magic, uint64 compressed size, uint64 uncompressed size,
+#   uint32 decompressor name offset, uint32 decompressor config offset,
+#   uint8 is_terminal  -- 29 bytes, in image byte order
+COMPRESSED_HEADER_MAGIC = 0xCAFEFAFA
+COMPRESSED_HEADER_FORMAT = 'IQQIIB'
+COMPRESSED_HEADER_SIZE = struct.calcsize('<' + COMPRESSED_HEADER_FORMAT)
 
-            attrs[kind] = value
+STREAM_CHUNK_SIZE = 64 * 1024
 
-        return attrs
 
-    # Process all entries from the offsets table
-    entries = []
-    for i in range(table_length):
-        loc_off = struct.unpack_from(endian + 'I', data, offsets_off + i * 4)[0]
-        if loc_off == 0:
-            continue
+class CompressedResourceHeader:
+    def __init__(self, compressed_size, uncompressed_size, decompressor_offset,
+                 content_offset, is_terminal):
+        self.compressed_size = compressed_size
+        self.uncompressed_size = uncompressed_size
+        self.decompressor_offset = decompressor_offset
+        self.content_offset = content_offset
+        self.is_terminal = is_terminal
 
-        attrs = decode_location(loc_off)
-        if attrs is None:
-            continue
+    @classmethod
+    def read(cls, resource, endian='<'):
+        """Parse the header at the start of resource, or return None."""
+        if len(resource) < COMPRESSED_HEADER_SIZE:
+            return None
+        magic, compressed, uncompressed, name_off, content_off, terminal = \
+            struct.unpack_from(endian + COMPRESSED_HEADER_FORMAT, resource, 0)
+        if magic != COMPRESSED_HEADER_MAGIC:
+            return None
+        return cls(compressed, uncompressed, name_off, content_off, bool(terminal))
+
+
+def zip_decompress(strings, payload, uncompressed_size):
+    """'zip' plugin: a zlib stream written by java.util.zip.Deflater."""
+    return zlib.decompress(payload, zlib.MAX_WBITS, uncompressed_size or zlib.DEF_BUF_SIZE)
+
+
+# compact-cp constant pool tags
+CONSTANT_UTF8 = 1
+CONSTANT_LONG = 5
+CONSTANT_DOUBLE = 6
+EXTERNALIZED_STRING = 23
+EXTERNALIZED_STRING_DESCRIPTOR = 25
+
+# Payload size of the other constant pool entries, by tag
+CONSTANT_SIZES = {
+    3: 4, 4: 4, 5: 8, 6: 8, 7: 2, 8: 2, 9: 4, 10: 4, 11: 4, 12: 4,
+    15: 3, 16: 2, 17: 4, 18: 4, 19: 2, 20: 2,
+}
+
+
+def read_compressed_index(buf, pos):
+    """Read a CompressIndexes-encoded int; return (value, new_pos).
+
+    If bit 7 of the first byte is set, bits 5-6 give the total length
+    (1-3 bytes) and bits 0-4 the top of the value; otherwise the value is
+    a plain 4-byte big-endian int.
+    """
+    b = buf[pos]
+    if b & 0x80:
+        size = (b >> 5) & 3
+        value = b & 0x1F
+    else:
+        size = 4
+        value = b
+    for i in range(1, size):
+        value = (value << 8) | buf[pos + i]
+    return value, pos + size
+
+
+def compact_cp_decompress(strings, payload, uncompressed_size):
+    """'compact-cp' plugin (StringSharingDecompressor).
+
+    Rebuilds the class file constant pool: UTF-8 entries that were moved
+    into the image string table (tag 23), and descriptors whose class names
+    were split into package/class strings (tag 25), become CONSTANT_Utf8
+    again. Everything after the constant pool is copied unchanged.
+    """
+    buf = payload
+    out = bytearray()
+    out += buf[:8]  # magic, minor, major
+    cp_count = struct.unpack_from('>H', buf, 8)[0]
+    out += buf[8:10]
+    pos = 10
+
+    def shared_string(index):
+        raw = strings.get_string_bytes(index)
+        if raw is None:
+            raise ValueError(f"compact-cp: string offset {index} is outside the string table")
+        return raw
 
-        module_off = attrs[1]  # ATTRIBUTE_MODULE
-        parent_off = attrs[2]  # ATTRIBUTE_PARENT
-        base_off = attrs[3]    # ATTRIBUTE_BASE
-        ext_off = attrs[4]     # ATTRIBUTE_EXTENSION
-        content_offset = attrs[5]  # ATTRIBUTE_OFFSET
-        compressed = attrs[6]  # ATTRIBUTE_COMPRESSED
-        uncompressed = attrs[7]  # ATTRIBUTE_UNCOMPRESSED
-
-        module = get_string(module_off) or ''
-        parent = get_string(parent_off) or ''
-        base = get_string(base_off) or ''
-        ext = get_string(ext_off) or ''
-
-        if ext:
-            full_path = f"/{module}/{parent}{base}.{ext}"
+    def write_utf8(raw):
+        out.append(CONSTANT_UTF8)
+        out.extend(struct.pack('>H', len(raw)))
+        out.extend(raw)
+
+    i = 1
+    while i < cp_count:
+        tag = buf[pos]
+        pos += 1
+        if tag == CONSTANT_UTF8:
+            length = struct.unpack_from('>H', buf, pos)[0]
+            out.append(tag)
+            out += buf[pos:pos + 2 + length]
+            pos += 2 + length
+        elif tag == EXTERNALIZED_STRING:
+            index, pos = read_compressed_index(buf, pos)
+            write_utf8(shared_string(index))
+        elif tag == EXTERNALIZED_STRING_DESCRIPTOR:
+            desc_index, pos = read_compressed_index(buf, pos)
+            flow_size, pos = read_compressed_index(buf, pos)
+            flow_end = pos + flow_size
+            indexes = []
+            while pos < flow_end:
+                value, pos = read_compressed_index(buf, pos)
+                indexes.append(value)
+            # Every 'L' in the stripped descriptor is followed by the
+            # package and simple class name taken from the flow, in order.
+            desc = shared_string(desc_index)
+            result = bytearray()
+            arg = 0
+            for c in desc:
+                result.append(c)
+                if c == 0x4C:  # 'L'
+                    pkg = shared_string(indexes[arg])
+                    if pkg:
+                        result += pkg + b'/'
+                    result += shared_string(indexes[arg + 1])
+                    arg += 2
+            write_utf8(bytes(result))
+        elif tag in CONSTANT_SIZES:
+            size = CONSTANT_SIZES[tag]
+            out.append(tag)
+            out += buf[pos:pos + size]
+            pos += size
+            if tag in (CONSTANT_LONG, CONSTANT_DOUBLE):
+                i += 1
         else:
-            full_path = f"/{module}/{parent}{base}"
-
-        entries.append({
-            'module': module,
-            'parent': parent,
-            'base': base,
-            'extension': ext,
-            'full_path': full_path,
-            'content_offset': content_offset,
-            'compressed_size': compressed,
-            'uncompressed_size': uncompressed,
-        })
-
-    return entries, data, resources_off
+            raise ValueError(f"compact-cp: unknown constant pool tag {tag} at {pos - 1}")
+        i += 1
+
+    out += buf[pos:]
+    return bytes(out)
+
+
+DECOMPRESSORS = {
+    'zip': zip_decompress,
+    'compact-cp': compact_cp_decompress,
+}
+
+
+def _get_decompressor(strings, header):
+    name = strings.get_string(header.decompressor_offset)
+    decompressor = DECOMPRESSORS.get(name)
+    if decompressor is None:
+        raise ValueError(f"Unsupported JIMAGE decompressor: {name!r}")
+    return name, decompressor
+
+
+def decompress_resource(strings, resource, endian='<'):
+    """Undo every compression layer of a stored resource.
+
+    Each layer starts with a CompressedResourceHeader naming its plugin;
+    layers are peeled off one at a time (e.g. zip around compact-cp) until
+    the content no longer starts with a header. Each layer is decoded
+    exactly once by the plugin it names. A compressed resource that does
+    not start with a header raises ValueError instead of being returned
+    as is.
+    """
+    header = CompressedResourceHeader.read(resource, endian)
+    if header is None:
+        raise ValueError(f"compressed resource has no CompressedResourceHeader "
+                         f"(starts with {bytes(resource[:8]).hex(' ')})")
+    while header is not None:
+        name, decompressor = _get_decompressor(strings, header)
+        payload = resource[COMPRESSED_HEADER_SIZE:]
+        try:
+            resource = decompressor(strings, payload, header.uncompressed_size)
+        except (IndexError, struct.error) as e:
+            raise ValueError(f"{name}: truncated or corrupt payload ({e})") from e
+        if len(resource) != header.uncompressed_size:
+            raise ValueError(f"{name}: expected {header.uncompressed_size} bytes, "
+                             f"got {len(resource)}")
+        header = CompressedResourceHeader.read(resource, endian)
+    return resource
 
 
-def extract_resource(data, resources_off, entry):
-    """Extract raw bytes of a resource from the JIMAGE data."""
+def _stored_bytes(data, resources_off, entry):
     offset = resources_off + entry['content_offset']
     size = entry['compressed_size'] if entry['compressed_size'] > 0 else entry['uncompressed_size']
-    if size == 0:
-        return b''
-    raw = data[offset:offset + size]
+    return memoryview(data)[offset:offset + size]
+
+
+def extract_resource(data, resources_off, entry, strings, endian='<'):
+    """Extract the (decompressed) bytes of a resource from the JIMAGE data.
+
+    strings is the LocationIndex (or anything with get_string and
+    get_string_bytes) used to resolve decompressor names and shared strings.
+    """
+    raw = _stored_bytes(data, resources_off, entry)
+    if entry['compressed_size'] == 0:
+        return bytes(raw)
+    return decompress_resource(strings, raw, endian)
+
+
+def write_resource(out, data, resources_off, entry, strings, endian='<'):
+    """Stream a resource into the binary file object out; return bytes written.
+
+    A single terminal 'zip' layer (what --compress=2 produces) is inflated
+    chunk by chunk straight into out; anything else is decompressed in
+    memory first.
+    """
+    raw = _stored_bytes(data, resources_off, entry)
+    if entry['compressed_size'] == 0:
+        out.write(raw)
+        return len(raw)
+
+    header = CompressedResourceHeader.read(raw, endian)
+    if header is None or not header.is_terminal or \
+            _get_decompressor(strings, header)[0] != 'zip':
+        content = decompress_resource(strings, raw, endian)
+        out.write(content)
+        return len(content)
+
+    chunks = (raw[start:start + STREAM_CHUNK_SIZE]
+              for start in range(COMPRESSED_HEADER_SIZE, len(raw), STREAM_CHUNK_SIZE))
+    return _inflate_chunks(out, chunks, header.uncompressed_size)
+
+
+def _inflate_chunks(out, chunks, expected_size):
+    """Inflate a zlib stream given as chunks into out; return bytes written."""
+    inflater = zlib.decompressobj(zlib.MAX_WBITS)
+    written = 0
+    for compressed in chunks:
+        chunk = inflater.decompress(compressed, STREAM_CHUNK_SIZE)
+        while chunk:
+            out.write(chunk)
+            written += len(chunk)
+            chunk = inflater.decompress(inflater.unconsumed_tail, STREAM_CHUNK_SIZE)
+    chunk = inflater.flush()
+    out.write(chunk)
+    written += len(chunk)
+    if not inflater.eof or written != expected_size:
+        raise ValueError(f"zip: truncated stream ({written} of {expected_size} bytes)")
+    return written
+
+
+# Per-process state of the --jobs decompression workers
+_worker = {}
+
+
+def _init_worker(filepath, string_data, resources_off, endian):
+    with open(filepath, 'rb') as f:
+        _worker['data'] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    _worker['strings'] = StringTable(string_data)
+    _worker['resources_off'] = resources_off
+    _worker['endian'] = endian
+
+
+def _decompress_task(entry):
+    """Worker side of extract_entries: return (content, error message)."""
+    try:
+        return extract_resource(_worker['data'], _worker['resources_off'], entry,
+                                _worker['strings'], _worker['endian']), None
+    except (ValueError, zlib.error) as e:
+        return None, str(e)
+
+
+def extract_entries(entries, data, resources_off, index, output_dir,
+                    filepath=None, jobs=1, endian='<'):
+    """Extract entries under output_dir, preserving their full paths.
+
+    Parent directories are created once up front. With jobs > 1 compressed
+    resources are decompressed in a process pool (each worker maps the image
+    at filepath itself) and all files are written through a thread pool; the
+    output is byte-identical to the serial path. Every file is written to a
+    .tmp file first and renamed into place, so an interrupted run never
+    leaves a partial output file. endian is the image byte
+    order, which compressed resource headers are read in.
+
+    Returns the full paths of entries that could not be extracted; their
+    existing output files are left as they were.
+    """
+    failed = []
+    out_paths = [os.path.join(output_dir, e['full_path'].lstrip('/')) for e in entries]
+    make_output_dirs(out_paths)
+
+    if jobs <= 1:
+        for out_path, entry in zip(out_paths, entries):
+            try:
+                with atomic_open(out_path) as f:
+                    write_resource(f, data, resources_off, entry, index, endian)
+            except (ValueError, zlib.error) as e:
+                print(f"Error extracting {entry['full_path']}: {e}")
+                failed.append(entry['full_path'])
+        return failed
+
+    compressed = [(p, e) for p, e in zip(out_paths, entries) if e['compressed_size'] > 0]
+    plain = [(p, e) for p, e in zip(out_paths, entries) if e['compressed_size'] == 0]
+
+    with ThreadPoolExecutor(max_workers=jobs) as writers:
+        futures = [writers.submit(write_file, p, _stored_bytes(data, resources_off, e))
+                   for p, e in plain]
+        if compressed:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                     initargs=(filepath, index.string_data, resources_off,
+                                               endian)) as pool:
+                results = pool.map(_decompress_task, [e for _, e in compressed],
+                                   chunksize=max(1, len(compressed) // (jobs * 8)))
+                for (out_path, entry), (content, error) in zip(compressed, results):
+                    if error is not None:
+                        print(f"Error extracting {entry['full_path']}: {error}")
+                        failed.append(entry['full_path'])
+                        continue
+                    futures.append(writers.submit(write_file, out_path, content))
+        for future in futures:
+            future.result()
+    return failed
+
+
+# Manifest of what extract_incremental wrote, kept in the output directory
+MANIFEST_NAME = '.jimage-manifest.json'
+MANIFEST_VERSION = 1
+
+
+def load_manifest(output_dir):
+    """Return the manifest dict of a previous extraction, or None."""
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def content_hash(data, resources_off, entry):
+    """Hash of a resource's stored (possibly still compressed) bytes."""
+    return hashlib.blake2b(_stored_bytes(data, resources_off, entry), digest_size=16).hexdigest()
+
+
+def extract_incremental(entries, data, resources_off, index, output_dir,
+                        filepath, jobs=1, endian='<'):
+    """Extract only the entries that changed since the last run.
+
+    The manifest records the image's size and mtime plus, per entry, its
+    content offset, sizes and a hash of the stored bytes. If the image is
+    unchanged, records with the same offset and sizes are reused without
+    hashing; otherwise each entry is hashed and compared. Entries whose
+    hash matches and whose output file is intact are skipped, files of
+    entries no longer present are deleted, and the manifest is rewritten.
+    An entry that fails keeps its previous file and is recorded without a
+    hash, so the next run tries it again.
+
+    Returns a dict of sorted full-path lists: added, changed, removed,
+    unchanged and failed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    st = os.stat(filepath)
+    image = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    old = load_manifest(output_dir)
+    old_entries = old['entries'] if old else {}
+    same_image = old is not None and old['image'] == image
+
+    report = {'added': [], 'changed': [], 'removed': [], 'unchanged': [], 'failed': []}
+    new_entries = {}
+    to_extract = []
+    for entry in entries:
+        path = entry['full_path']
+        prev = old_entries.get(path)
+        record = {
+            'content_offset': entry['content_offset'],
+            'compressed_size': entry['compressed_size'],
+            'uncompressed_size': entry['uncompressed_size'],
+        }
+        if same_image and prev and prev['hash'] and all(prev[k] == v for k, v in record.items()):
+            record['hash'] = prev['hash']
+        else:
+            record['hash'] = content_hash(data, resources_off, entry)
+        new_entries[path] = record
+
+        out_path = os.path.join(output_dir, path.lstrip('/'))
+        if prev is None:
+            report['added'].append(path)
+        elif prev['hash'] != record['hash'] or not os.path.isfile(out_path) or \
+                os.path.getsize(out_path) != record['uncompressed_size']:
+            report['changed'].append(path)
+        else:
+            report['unchanged'].append(path)
+            continue
+        to_extract.append(entry)
 
-    # If compressed, try to decompress
-    if entry['compressed_size'] > 0 and entry['compressed_size'] != entry['uncompressed_size']:
+    report['failed'] = extract_entries(to_extract, data, resources_off, index, output_dir,
+                                       filepath=filepath, jobs=jobs, endian=endian)
+    for path in report['failed']:
+        new_entries[path]['hash'] = None
+
+    for path in old_entries:
+        if path in new_entries:
+            continue
+        report['removed'].append(path)
+        out_path = os.path.join(output_dir, path.lstrip('/'))
         try:
-            # JIMAGE uses ZIP (deflate) compression with a header
-            # The compressed resource has a CompressedResourceHeader:
-            # uint32 magic (0xCAFEDADA), uint32 size, uint32 uncompressed_size, uint32 decompressor_name_offset, uint32 ...
-            # Then the compressed data follows
-            # Let's try raw zlib decompression first
-            decompressed = zlib.decompress(raw)
-            return decompressed
-        except zlib.error:
-            # Try with different wbits
-            try:
-                decompressed = zlib.decompress(raw, -zlib.MAX_WBITS)
-                return decompressed
-            except zlib.error:
-                # Try skipping a header
+            os.remove(out_path)
+            os.removedirs(os.path.dirname(out_path))
+        except OSError:
+            pass
+
+    save_manifest(output_dir, {'version': MANIFEST_VERSION, 'image': image,
+                               'entries': new_entries})
+    for paths in report.values():
+        paths.sort()
+    return report
+
+
+def _archive_kind(archive_path):
+    """'zip', or the tarfile stream mode for a tar path."""
+    name = archive_path.lower()
+    if name.endswith('.zip') or name.endswith('.jar'):
+        return 'zip'
+    if name.endswith('.tar.gz') or name.endswith('.tgz'):
+        return 'w|gz'
+    if name.endswith('.tar.xz'):
+        return 'w|xz'
+    if name.endswith('.tar'):
+        return 'w|'
+    raise ValueError(f"Unsupported archive type: {archive_path} (use .zip, .tar, .tar.gz or .tar.xz)")
+
+
+def extract_to_archive(entries, data, resources_off, index, archive_path, mtime=None,
+                       endian='<'):
+    """Stream entries into a single zip or tar archive instead of one file each.
+
+    Members are named after the entry's full path (without the leading
+    slash) and written sequentially: zip members are copied straight into
+    the deflater, tar members go through tarfile's non-seeking stream mode.
+    Compressed resources are decompressed in memory before their member is
+    started, so an entry that fails is left out instead of truncated.
+    Nothing is staged on disk. mtime (default: now) stamps every member so
+    archives of the same image are reproducible.
+
+    Returns the full paths of entries that could not be extracted.
+    """
+    kind = _archive_kind(archive_path)
+    if mtime is None:
+        mtime = time.time()
+    failed = []
+    os.makedirs(os.path.dirname(os.path.abspath(archive_path)), exist_ok=True)
+
+    if kind == 'zip':
+        date_time = time.localtime(max(mtime, 315532800))[:6]  # zip dates start in 1980
+        with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for entry in entries:
+                info = zipfile.ZipInfo(entry['full_path'].lstrip('/'), date_time=date_time)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.file_size = entry['uncompressed_size']
+                if entry['compressed_size'] == 0:
+                    with zf.open(info, 'w') as out:
+                        out.write(_stored_bytes(data, resources_off, entry))
+                    continue
                 try:
-                    # Skip 4-byte header
-                    decompressed = zlib.decompress(raw[4:], -zlib.MAX_WBITS)
-                    return decompressed
-                except:
-                    pass
-        # Return raw if decompression fails
-        return raw
-
-    return raw
+                    content = extract_resource(data, resources_off, entry, index, endian)
+                except (ValueError, zlib.error) as e:
+                    print(f"Error extracting {entry['full_path']}: {e}")
+                    failed.append(entry['full_path'])
+                    continue
+                with zf.open(info, 'w') as out:
+                    out.write(content)
+        return failed
+
+    with tarfile.open(archive_path, kind) as tf:
+        for entry in entries:
+            try:
+                content = extract_resource(data, resources_off, entry, index, endian)
+            except (ValueError, zlib.error) as e:
+                print(f"Error extracting {entry['full_path']}: {e}")
+                failed.append(entry['full_path'])
+                continue
+            info = tarfile.TarInfo(entry['full_path'].lstrip('/'))
+            info.size = len(content)
+            info.mtime = int(mtime)
+            tf.addfile(info, io.BytesIO(content))
+    return failed
+
+
+def _file_chunks(f, start, size):
+    """Read size bytes at start from f, STREAM_CHUNK_SIZE at a time."""
+    f.seek(start)
+    while size > 0:
+        chunk = f.read(min(STREAM_CHUNK_SIZE, size))
+        if not chunk:
+            raise ValueError("resource runs past the end of the image")
+        size -= len(chunk)
+        yield chunk
+
+
+def _entry_at(image, strings, loc_offset):
+    """Entry dict of one location, without JImageParser's string cache."""
+    attrs = image.decode_location(loc_offset)
+    module = strings.get_string(attrs.get(ATTRIBUTE_MODULE, 0)) or ''
+    parent = strings.get_string(attrs.get(ATTRIBUTE_PARENT, 0)) or ''
+    base = strings.get_string(attrs.get(ATTRIBUTE_BASE, 0)) or ''
+    ext = strings.get_string(attrs.get(ATTRIBUTE_EXTENSION, 0)) or ''
+    return {
+        'module': module,
+        'parent': parent,
+        'base': base,
+        'extension': ext,
+        'full_path': build_full_name(module, parent, base, ext),
+        'content_offset': attrs.get(ATTRIBUTE_OFFSET, 0),
+        'compressed_size': attrs.get(ATTRIBUTE_COMPRESSED, 0),
+        'uncompressed_size': attrs.get(ATTRIBUTE_UNCOMPRESSED, 0),
+    }
 
 
-def main():
-    jimage_path = "C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/lib/modules"
-    output_dir = "C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted"
+def _peak_rss():
+    """Peak resident set size of this process in bytes, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def extract_streaming(filepath, modules, output_dir, budget, extensions=('class',)):
+    """Extract the resources of modules under output_dir within a memory budget.
+
+    The image is not read into memory: locations and strings come from the
+    mmap'd header sections, and resources are read with plain file reads in
+    content-offset order, so the reads are sequential. Only the location
+    offsets of the wanted resources are kept (in one array, sorted by
+    content offset); each entry dict and resource buffer is dropped once
+    its file is written. A resource that does not fit in what is left of
+    budget (bytes) is copied, or inflated when it is a single zip layer, in
+    STREAM_CHUNK_SIZE pieces; any other oversized resource fails. budget
+    must leave room for two chunks on top of the index.
+
+    Returns (failed full paths, peak bytes held in buffers).
+    """
+    failed = []
+    with JImageParser(filepath) as image, open(filepath, 'rb') as f:
+        strings = StringTable(bytes(image.data[image.strings_offset:
+                                               image.strings_offset + image.strings_size]))
+        locations = image.resource_locations(modules)
+        # (content offset, location offset) keys, sorted; the list built by
+        # sorted() is temporary
+        shift = max(locations, default=0).bit_length()
+        keys = array('Q', sorted((image.decode_location(loc).get(ATTRIBUTE_OFFSET, 0) << shift) | loc
+                                 for loc in locations))
+        del locations
+        mask = (1 << shift) - 1
+        fixed = len(strings.string_data) + keys.itemsize * len(keys)
+        if fixed + 2 * STREAM_CHUNK_SIZE > budget:
+            raise ValueError(f"memory budget of {budget} bytes is too small: the index needs "
+                             f"{fixed} bytes plus {2 * STREAM_CHUNK_SIZE} for streaming")
+        peak = fixed
+
+        made_dirs = set()
+        for key in keys:
+            entry = _entry_at(image, strings, key & mask)
+            if extensions is not None and entry['extension'] not in extensions:
+                continue
+            out_path = os.path.join(output_dir, entry['full_path'].lstrip('/'))
+            directory = os.path.dirname(out_path)
+            if directory not in made_dirs:
+                os.makedirs(directory, exist_ok=True)
+                made_dirs.add(directory)
+
+            start = image.resources_offset + entry['content_offset']
+            stored = entry['compressed_size'] or entry['uncompressed_size']
+            compressed = entry['compressed_size'] > 0
+            need = stored + (entry['uncompressed_size'] if compressed else 0)
+            try:
+                with open(out_path, 'wb') as out:
+                    if fixed + need <= budget:
+                        f.seek(start)
+                        raw = f.read(stored)
+                        out.write(decompress_resource(strings, raw, image.endian) if compressed else raw)
+                        del raw
+                    elif not compressed:
+                        need = STREAM_CHUNK_SIZE
+                        for chunk in _file_chunks(f, start, stored):
+                            out.write(chunk)
+                    else:
+                        f.seek(start)
+                        header = CompressedResourceHeader.read(f.read(COMPRESSED_HEADER_SIZE),
+                                                               image.endian)
+                        if header is None or not header.is_terminal or \
+                                _get_decompressor(strings, header)[0] != 'zip':
+                            raise ValueError(f"needs {need} bytes, over the memory budget")
+                        need = 2 * STREAM_CHUNK_SIZE
+                        _inflate_chunks(out, _file_chunks(f, start + COMPRESSED_HEADER_SIZE,
+                                                          stored - COMPRESSED_HEADER_SIZE),
+                                        header.uncompressed_size)
+            except (ValueError, zlib.error) as e:
+                print(f"Error extracting {entry['full_path']}: {e}")
+                os.remove(out_path)
+                failed.append(entry['full_path'])
+            peak = max(peak, fixed + need)
+    return failed, peak
+
+
+def iter_image_resources(image, modules=None, extensions=('class',)):
+    """Yield (entry, content) for the resources of modules, in content order.
+
+    image is an open JImageParser; modules=None means every module. Stored
+    resources come back as zero-copy memoryviews of the image, compressed
+    ones as the decompressed bytes, so nothing touches the disk. The views
+    are only valid while the image is open (or, after close(), while they
+    are referenced).
+    """
+    strings = StringTable(bytes(image.data[image.strings_offset:
+                                           image.strings_offset + image.strings_size]))
+    entries = [_entry_at(image, strings, loc) for loc in image.resource_locations(modules)]
+    entries = [e for e in entries if extensions is None or e['extension'] in extensions]
+    entries.sort(key=lambda e: e['content_offset'])
+    for entry in entries:
+        raw = _stored_bytes(image.data, image.resources_offset, entry)
+        if entry['compressed_size']:
+            try:
+                raw = decompress_resource(strings, raw, image.endian)
+            except (ValueError, zlib.error) as e:
+                raise ValueError(f"{entry['full_path']}: {e}") from e
+        yield entry, raw
 
-    entries, data, resources_off = read_jimage(jimage_path)
 
-    # Count by module
-    mod_counts = Counter(e['module'] for e in entries)
-    print(f"\nTotal entries: {len(entries)}")
-    print("\nModules (sorted by entry count):")
-    for mod, count in mod_counts.most_common(30):
-        print(f"  {mod!r}: {count}")
+def main():
+    ap = argparse.ArgumentParser(description="Extract classes from a JIMAGE (lib/modules) file.")
+    ap.add_argument('jimage_path', nargs='?',
+                    default="C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/lib/modules")
+    ap.add_argument('output_dir', nargs='?',
+                    default="C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted")
+    ap.add_argument('--jobs', '-j', type=int, default=1,
+                    help="decompression processes / writer threads (default: 1)")
+    ap.add_argument('--full', action='store_true',
+                    help="rewrite every class instead of only the ones that changed")
+    ap.add_argument('--no-cache', action='store_true',
+                    help="do not read or write the on-disk location index cache")
+    ap.add_argument('--cache-dir',
+                    help="directory for the index cache (default: next to the image)")
+    ap.add_argument('--archive', metavar='PATH',
+                    help="write all classes into one .zip/.tar/.tar.gz archive instead of output_dir")
+    ap.add_argument('--max-memory', type=float, metavar='MB',
+                    help="stream the target classes to output_dir in content order, "
+                         "holding at most MB megabytes of index and resource buffers")
+    args = ap.parse_args()
+    jimage_path = args.jimage_path
+    output_dir = args.output_dir
 
     # Target modules
     target_modules = {
@@ -197,8 +867,66 @@ def main():
         'ch.iddqd.aoe4.aoe4replayparsergui'
     }
 
+    if args.max_memory is not None:
+        if args.archive:
+            ap.error("--max-memory cannot be combined with --archive")
+        budget = int(args.max_memory * 1024 * 1024)
+        print(f"\nStreaming {', '.join(sorted(target_modules))} "
+              f"(budget {budget / 1e6:.1f} MB)...")
+        try:
+            failed, peak = extract_streaming(jimage_path, sorted(target_modules), output_dir,
+                                             budget)
+        except ValueError as e:
+            ap.error(str(e))
+        for path in failed:
+            print(f"  failed: {path}")
+        rss = _peak_rss()
+        print(f"\nPeak memory: {peak / 1e6:.1f} MB in buffers"
+              + (f", {rss / 1e6:.1f} MB process RSS" if rss is not None else ""))
+        print(f"\nExtracted to: {output_dir}")
+        sys.exit(1 if failed else 0)
+
+    image = JImageParser(jimage_path)
+    modules = image.module_index()
+    if modules:
+        # The /modules and /packages metadata gives the module list, counts
+        # and each target's locations without decoding the whole table.
+        print(f"\nModules: {len(modules)}, resources: "
+              f"{sum(m['resources'] for m in modules.values())}")
+        print("\nModules (sorted by entry count):")
+        by_count = sorted(modules.items(), key=lambda kv: (-kv[1]['resources'], kv[0]))
+        for mod, info in by_count[:30]:
+            print(f"  {mod!r}: {info['resources']} ({len(info['packages'])} packages)")
+
+        index = StringTable(bytes(image.data[image.strings_offset:
+                                             image.strings_offset + image.strings_size]))
+        data, resources_off, endian = image.data, image.resources_offset, image.endian
+        module_entries = {mod_name: [location_entry(e) for e in image.module_entries(mod_name)]
+                          for mod_name in target_modules}
+        print("\nTarget module content ranges:")
+        for mod_name in sorted(target_modules):
+            mod_entries = module_entries[mod_name]
+            if mod_entries:
+                last = mod_entries[-1]
+                end = last['content_offset'] + (last['compressed_size'] or last['uncompressed_size'])
+                print(f"  {mod_name}: content {mod_entries[0]['content_offset']}-{end}")
+    else:
+        # No directory tree: scan every location
+        index = image_location_index(image, use_cache=not args.no_cache,
+                                     cache_dir=args.cache_dir)
+        data, resources_off, endian = image.data, image.resources_offset, image.endian
+        mod_counts = index.module_counts()
+        print(f"\nTotal entries: {len(index)}")
+        print("\nModules (sorted by entry count):")
+        for mod, count in mod_counts.most_common(30):
+            print(f"  {mod!r}: {count}")
+
+        module_entries = {mod_name: [] for mod_name in target_modules}
+        for e in index.iter_entries(modules=target_modules):
+            module_entries[e['module']].append(e)
+
     for mod_name in sorted(target_modules):
-        mod_entries = [e for e in entries if e['module'] == mod_name]
+        mod_entries = module_entries[mod_name]
         print(f"\n{'='*60}")
         print(f"Module: {mod_name} ({len(mod_entries)} entries)")
         print(f"{'='*60}")
@@ -206,20 +934,35 @@ def main():
             print(f"  {e['full_path']} (uncomp={e['uncompressed_size']}, comp={e['compressed_size']})")
 
     # Extract class files for target modules
-    for mod_name in sorted(target_modules):
-        mod_entries = [e for e in entries if e['module'] == mod_name]
-        class_entries = [e for e in mod_entries if e['extension'] == 'class']
-        print(f"\nExtracting {len(class_entries)} class files from {mod_name}...")
-
-        for entry in class_entries:
-            rel_path = entry['full_path'].lstrip('/')
-            out_path = os.path.join(output_dir, rel_path)
-            os.makedirs(os.path.dirname(out_path), exist_ok=True)
-            raw_data = extract_resource(data, resources_off, entry)
-            with open(out_path, 'wb') as f:
-                f.write(raw_data)
+    class_entries = [e for mod_name in sorted(target_modules)
+                     for e in module_entries[mod_name] if e['extension'] == 'class']
+    if args.archive:
+        print(f"\nArchiving {len(class_entries)} class files...")
+        failed = extract_to_archive(class_entries, data, resources_off, index, args.archive,
+                                    mtime=os.stat(jimage_path).st_mtime, endian=endian)
+        print(f"\nArchived to: {args.archive}")
+        image.close()
+        sys.exit(1 if failed else 0)
+    elif args.full:
+        print(f"\nExtracting {len(class_entries)} class files...")
+        failed = extract_entries(class_entries, data, resources_off, index, output_dir,
+                                 filepath=jimage_path, jobs=args.jobs, endian=endian)
+    else:
+        print(f"\nUpdating {len(class_entries)} class files...")
+        report = extract_incremental(class_entries, data, resources_off, index, output_dir,
+                                     filepath=jimage_path, jobs=args.jobs, endian=endian)
+        for kind in ('changed', 'removed', 'failed'):
+            for path in report[kind]:
+                print(f"  {kind}: {path}")
+        print(f"  {len(report['added'])} added, {len(report['changed'])} changed, "
+              f"{len(report['removed'])} removed, {len(report['unchanged'])} unchanged")
+        failed = report['failed']
 
     print(f"\nExtracted to: {output_dir}")
+    image.close()
+    if failed:
+        print(f"{len(failed)} class files could not be extracted")
+        sys.exit(1)
 
 
 if __name__ == '__main__':
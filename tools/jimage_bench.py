@@ -0,0 +1,147 @@
+"""
+Offline benchmark suite for the JIMAGE tools.
+
+Times the stages every extraction run goes through, on a synthetic image
+from jimage_synth (or an existing lib/modules file):
+  - header parse      JImageParser open and close (mmap + header + section layout)
+  - full listing      JImageParser.list_entries and extract_jimage.read_jimage
+  - module index      JImageParser.module_index (/modules and /packages metadata)
+  - path lookup       JImageParser.find on random resource paths
+  - bulk extraction   extract_jimage.extract_resource over every class,
+                      including decompression
+
+and reports entries/s and MB/s so regressions can be measured on Linux.
+
+Usage:
+  python jimage_bench.py                         # 5000-class synthetic image
+  python jimage_bench.py --resources 30000 --zip 0.5 --compact-cp 0.2
+  python jimage_bench.py --image path/to/lib/modules
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+
+import extract_jimage
+from jimage_parser import JImageParser
+from jimage_synth import generate_image
+
+
+def _quiet(fn, *args, **kwargs):
+    """Call fn with its progress prints swallowed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+
+def best_of(repeat, fn):
+    """Run fn repeat times; return (best seconds, last result)."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run_benchmarks(image_path, repeat=3, lookups=1000, seed=0):
+    """Run every benchmark on image_path; return a list of result rows.
+
+    Each row is (name, seconds, items, bytes); items and bytes may be 0
+    when a rate does not apply.
+    """
+    size = os.path.getsize(image_path)
+    rows = []
+
+    def open_close():
+        _quiet(JImageParser, image_path).close()
+    t, _ = best_of(repeat, open_close)
+    rows.append(('header parse', t, 1, 0))
+
+    def listing():
+        with _quiet(JImageParser, image_path) as image:
+            return image.list_entries()
+    t, entries = best_of(repeat, listing)
+    rows.append(('full listing (JImageParser)', t, len(entries), 0))
+
+    t, (index, data, resources_off) = best_of(
+        repeat, lambda: _quiet(extract_jimage.read_jimage, image_path, use_cache=False))
+    rows.append(('full listing (read_jimage)', t, len(index), 0))
+
+    def module_index():
+        with _quiet(JImageParser, image_path) as image:
+            return image.module_index()
+    t, modules = best_of(repeat, module_index)
+    rows.append(('module index', t, sum(m['resources'] for m in modules.values()), 0))
+
+    paths = [e['full_path'] for e in entries]
+    sample = random.Random(seed).choices(paths, k=lookups) if paths else []
+
+    with _quiet(JImageParser, image_path) as parser:
+        def lookup():
+            for path in sample:
+                parser.find(path)
+        t, _ = best_of(repeat, lookup)
+    rows.append(('path lookup', t, len(sample), 0))
+
+    class_entries = list(index.iter_entries(extensions=['class']))
+    stored = sum(e['compressed_size'] or e['uncompressed_size'] for e in class_entries)
+
+    def extract_all():
+        total = 0
+        for e in class_entries:
+            total += len(extract_jimage.extract_resource(data, resources_off, e, index))
+        return total
+    t, total = best_of(repeat, extract_all)
+    rows.append(('bulk extraction', t, len(class_entries), total))
+
+    print(f"Image: {image_path} ({size / 1e6:.1f} MB, {len(entries)} locations, "
+          f"{len(class_entries)} classes, {stored / 1e6:.1f} MB stored, "
+          f"{total / 1e6:.1f} MB uncompressed)")
+    return rows
+
+
+def print_results(rows):
+    print(f"\n{'benchmark':<30} {'time':>10} {'entries/s':>12} {'MB/s':>10}")
+    print('-' * 65)
+    for name, seconds, items, nbytes in rows:
+        rate = f"{items / seconds:,.0f}" if items and seconds else '-'
+        mbs = f"{nbytes / seconds / 1e6:,.1f}" if nbytes and seconds else '-'
+        print(f"{name:<30} {seconds * 1000:>8.2f}ms {rate:>12} {mbs:>10}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the JIMAGE tools on a synthetic or real image.")
+    ap.add_argument('--image', help="benchmark this image instead of generating one")
+    ap.add_argument('--resources', type=int, default=5000)
+    ap.add_argument('--modules', type=int, default=8)
+    ap.add_argument('--zip', type=float, default=0.5)
+    ap.add_argument('--compact-cp', type=float, default=0.0)
+    ap.add_argument('--shared-names', type=float, default=0.3)
+    ap.add_argument('--members', type=int, default=20)
+    ap.add_argument('--repeat', type=int, default=3, help="runs per benchmark (best is reported)")
+    ap.add_argument('--lookups', type=int, default=1000)
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args()
+
+    if args.image:
+        print_results(run_benchmarks(args.image, args.repeat, args.lookups, args.seed))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = os.path.join(tmp, 'modules')
+        start = time.perf_counter()
+        generate_image(image_path, resources=args.resources, modules=args.modules,
+                       zip_ratio=args.zip, compact_cp_ratio=args.compact_cp,
+                       shared_names=args.shared_names, members=args.members, seed=args.seed)
+        print(f"Generated synthetic image in {time.perf_counter() - start:.1f}s")
+        print_results(run_benchmarks(image_path, args.repeat, args.lookups, args.seed))
+
+
+if __name__ == '__main__':
+    main()
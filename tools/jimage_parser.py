@@ -11,9 +11,15 @@ JIMAGE format:
   - Resource data (actual class file bytes, etc.)
 """
 
+import argparse
+import contextlib
+import hashlib
+import mmap
 import struct
 import sys
 import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # JIMAGE magic number
@@ -41,6 +47,250 @@ ATTRIBUTE_NAMES = {
     7: "UNCOMPRESSED",
 }
 
+# Seed/multiplier of the image's string hash (ImageStringsReader.HASH_MULTIPLIER)
+HASH_MULTIPLIER = 0x01000193
+
+
+def jimage_hash(name, seed=HASH_MULTIPLIER):
+    """Hash a resource name the way jlink does when building the redirect table.
+
+    FNV-style: for each UTF-8 byte, seed = (seed * HASH_MULTIPLIER) ^ byte,
+    with 32-bit wrap-around and the sign bit masked off at the end.
+    """
+    if isinstance(name, str):
+        name = name.encode('utf-8')
+    for b in name:
+        seed = ((seed * HASH_MULTIPLIER) ^ b) & 0xFFFFFFFF
+    return seed & 0x7FFFFFFF
+
+
+def decode_modified_utf8(raw):
+    """Decode a JVM modified-UTF-8 byte string.
+
+    Modified UTF-8 only differs from UTF-8 in encoding NUL as C0 80 and
+    supplementary characters as surrogate pairs, so plain UTF-8 decoding
+    is tried first and the slow path is only taken for those.
+    """
+    raw = bytes(raw)
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+    s = raw.replace(b'\xc0\x80', b'\x00').decode('utf-8', errors='surrogatepass')
+    # Join surrogate pairs into real code points
+    return s.encode('utf-16', errors='surrogatepass').decode('utf-16', errors='replace')
+
+
+def build_full_name(module, parent, base, extension):
+    """Rebuild a resource name the way ImageLocation.getFullName does."""
+    parts = []
+    if module:
+        parts.append(f"/{module}/")
+    if parent:
+        parts.append(f"{parent}/")
+    parts.append(base)
+    if extension:
+        parts.append(f".{extension}")
+    return ''.join(parts)
+
+
+ATTRIBUTE_COUNT = 8
+
+
+def _build_attribute_headers():
+    """Decode table for location attribute header bytes.
+
+    Entry b is (kind, value byte count, valid): kind = b >> 3 and
+    count = (b & 7) + 1, except that bytes <= 7 are END (kind 0) and
+    kinds above UNCOMPRESSED are invalid.
+    """
+    table = []
+    for b in range(256):
+        kind = b >> 3
+        if b <= 7:
+            table.append((ATTRIBUTE_END, 0, True))
+        else:
+            table.append((kind, (b & 7) + 1, kind < ATTRIBUTE_COUNT))
+    return tuple(table)
+
+
+ATTRIBUTE_HEADERS = _build_attribute_headers()
+
+
+def decode_attributes(buf, pos, end):
+    """Decode the location starting at buf[pos] (buf may be a memoryview).
+
+    Returns a list of ATTRIBUTE_COUNT values indexed by kind (0 where the
+    attribute is absent), or None if an invalid attribute kind is found.
+    This is the one decoder both JIMAGE tools use.
+    """
+    attrs = [0] * ATTRIBUTE_COUNT
+    headers = ATTRIBUTE_HEADERS
+    from_bytes = int.from_bytes
+    while pos < end:
+        kind, count, valid = headers[buf[pos]]
+        if not kind:
+            break
+        if not valid:
+            return None
+        pos += 1
+        if count == 1:
+            attrs[kind] = buf[pos]
+        else:
+            attrs[kind] = from_bytes(buf[pos:pos + count], 'big')
+        pos += count
+    return attrs
+
+
+# Column order of a decoded location table (attribute kinds 1-7)
+LOCATION_COLUMNS = ('module', 'parent', 'base', 'extension',
+                    'content_offset', 'compressed_size', 'uncompressed_size')
+
+
+def decode_location_table(data, offsets_off, table_length, locations_off,
+                          locations_size, endian='<'):
+    """Decode every location in one pass into a tuple of column arrays.
+
+    The offsets table is loaded as a single array('I') and the locations
+    section is scanned from one bytes object; decoded rows go into one flat
+    array('Q') that is then split into per-attribute columns (in
+    LOCATION_COLUMNS order, one slot per non-empty location).
+    """
+    offsets = array('I')
+    offsets.frombytes(bytes(data[offsets_off:offsets_off + table_length * 4]))
+    if (endian == '<') != (sys.byteorder == 'little'):
+        offsets.byteswap()
+
+    locs = bytes(data[locations_off:locations_off + locations_size])
+    size = len(locs)
+
+    flat = array('Q')
+    append_row = flat.extend
+    decode = decode_attributes
+    for loc_off in offsets:
+        if loc_off == 0:
+            continue
+        row = decode(locs, loc_off, size)
+        if row is not None:
+            append_row(row[1:])
+
+    width = len(LOCATION_COLUMNS)
+    columns = []
+    for k, name in enumerate(LOCATION_COLUMNS):
+        column = flat[k::width]
+        if name != 'content_offset':
+            column = array('I', column)
+        columns.append(column)
+    return tuple(columns)
+
+
+# On-disk cache of a decoded location table. Layout (little-endian):
+#   8s magic, u32 version, u64 image size, u64 image mtime_ns,
+#   7 x u32 JIMAGE header fields, u32 row count, u64 payload size,
+#   16s blake2b digest of the payload
+# followed by the payload: the LOCATION_COLUMNS arrays back to back.
+INDEX_CACHE_MAGIC = b'JIMGIDX\x00'
+INDEX_CACHE_VERSION = 1
+INDEX_CACHE_HEADER = struct.Struct('<8sIQQ7IIQ16s')
+
+
+def index_cache_path(image_path, cache_dir=None):
+    """Where the index cache of image_path lives."""
+    if cache_dir is None:
+        return image_path + '.idx'
+    key = hashlib.blake2b(os.path.abspath(image_path).encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, f"{os.path.basename(image_path)}-{key}.idx")
+
+
+def _column_typecode(name):
+    return 'Q' if name == 'content_offset' else 'I'
+
+
+def load_index_cache(cache_path, image_size, image_mtime_ns, header_fields):
+    """Return the cached columns, or None if the cache is missing, stale or corrupt."""
+    try:
+        with open(cache_path, 'rb') as f:
+            blob = f.read()
+    except OSError:
+        return None
+    if len(blob) < INDEX_CACHE_HEADER.size:
+        return None
+    (magic, version, size, mtime_ns, *fields, rows, payload_size, digest) = \
+        INDEX_CACHE_HEADER.unpack_from(blob, 0)
+    if (magic != INDEX_CACHE_MAGIC or version != INDEX_CACHE_VERSION
+            or size != image_size or mtime_ns != image_mtime_ns
+            or tuple(fields) != tuple(header_fields)):
+        return None
+    payload = memoryview(blob)[INDEX_CACHE_HEADER.size:]
+    expected = sum(rows * array(_column_typecode(name)).itemsize for name in LOCATION_COLUMNS)
+    if len(payload) != payload_size or payload_size != expected or \
+            hashlib.blake2b(payload, digest_size=16).digest() != digest:
+        return None
+
+    columns = []
+    pos = 0
+    for name in LOCATION_COLUMNS:
+        column = array(_column_typecode(name))
+        end = pos + rows * column.itemsize
+        column.frombytes(payload[pos:end])
+        if sys.byteorder != 'little':
+            column.byteswap()
+        columns.append(column)
+        pos = end
+    return tuple(columns)
+
+
+def save_index_cache(cache_path, image_size, image_mtime_ns, header_fields, columns):
+    """Write columns to cache_path atomically. Failures are reported, not raised."""
+    parts = []
+    for column in columns:
+        if sys.byteorder != 'little':
+            column = array(column.typecode, column)
+            column.byteswap()
+        parts.append(column.tobytes())
+    payload = b''.join(parts)
+    header = INDEX_CACHE_HEADER.pack(
+        INDEX_CACHE_MAGIC, INDEX_CACHE_VERSION, image_size, image_mtime_ns,
+        *header_fields, len(columns[0]), len(payload),
+        hashlib.blake2b(payload, digest_size=16).digest())
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Could not write index cache {cache_path}: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def load_location_table(image_path, data, header_fields, offsets_off, locations_off,
+                        endian='<', use_cache=True, cache_dir=None):
+    """Decoded location columns of an image, from the index cache when valid.
+
+    header_fields are the 7 header words (magic, version, flags,
+    resource_count, table_length, locations_size, strings_size). A missing,
+    stale or corrupt cache is rebuilt by decoding the table.
+    """
+    table_length, locations_size = header_fields[4], header_fields[5]
+    if not use_cache:
+        return decode_location_table(data, offsets_off, table_length,
+                                     locations_off, locations_size, endian)
+
+    st = os.stat(image_path)
+    cache_path = index_cache_path(image_path, cache_dir)
+    columns = load_index_cache(cache_path, st.st_size, st.st_mtime_ns, header_fields)
+    if columns is None:
+        columns = decode_location_table(data, offsets_off, table_length,
+                                        locations_off, locations_size, endian)
+        save_index_cache(cache_path, st.st_size, st.st_mtime_ns, header_fields, columns)
+    return columns
+
+
 class JImageHeader:
     def __init__(self, data):
         # Header is 16 bytes
@@ -65,6 +315,12 @@ class JImageHeader:
         # Read strings size from offset 24
         self.strings_size = struct.unpack_from(self.endian + 'I', data, 24)[0]
 
+    def fields(self):
+        """The 7 raw header words, in file order."""
+        return (self.magic, (self.version_major << 16) | self.version_minor, self.flags,
+                self.resource_count, self.table_length, self.locations_size,
+                self.strings_size)
+
     def __repr__(self):
         return (f"JImageHeader(version={self.version_major}.{self.version_minor}, "
                 f"resources={self.resource_count}, table_len={self.table_length}, "
@@ -72,11 +328,22 @@ class JImageHeader:
 
 
 class JImageParser:
-    def __init__(self, filepath):
+    def __init__(self, filepath, use_mmap=True, preload_strings=False,
+                 index_cache=False, cache_dir=None):
         self.filepath = filepath
-        self.f = open(filepath, 'rb')
-        self.data = self.f.read()
-        self.f.close()
+        # With use_mmap the image is mapped read-only and every section is
+        # accessed through memoryview slices, so nothing is copied until a
+        # caller converts a resource to bytes and RSS only grows with the
+        # pages actually touched.
+        self._mmap = None
+        if use_mmap:
+            with open(filepath, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._buf = self._mmap
+        else:
+            with open(filepath, 'rb') as f:
+                self._buf = f.read()
+        self.data = memoryview(self._buf)
 
         # Parse header
         self.header = JImageHeader(self.data)
@@ -114,6 +381,44 @@ class JImageParser:
         print(f"Strings:        offset={self.strings_offset}, size={self.strings_size}")
         print(f"Resources:      offset={self.resources_offset}")
 
+        # String table cache: offset -> interned str. Filled on demand by
+        # get_string, or all at once by preload_strings().
+        self._strings = {}
+        if preload_strings:
+            self.preload_strings()
+
+        # Decoded location columns (see LOCATION_COLUMNS); when loaded,
+        # iter_entries reads them instead of decoding locations.
+        self.columns = None
+        if index_cache:
+            self.load_index(cache_dir)
+
+    def load_index(self, cache_dir=None, use_cache=True):
+        """Load the whole location table as columns, via the on-disk cache."""
+        self.columns = load_location_table(self.filepath, self.data, self.header.fields(),
+                                           self.offsets_offset, self.locations_offset,
+                                           self.endian, use_cache=use_cache,
+                                           cache_dir=cache_dir)
+        return self.columns
+
+    def close(self):
+        """Release the image buffer (unmaps the file in mmap mode)."""
+        self.data.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Views returned by extract_resource are still alive; the
+                # mapping is released once they are garbage collected.
+                pass
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
     def _compute_header_size(self):
         # JIMAGE header in OpenJDK is typically:
         # 4 bytes magic + 4 bytes version + 4 bytes flags +
@@ -127,138 +432,414 @@ class JImageParser:
         # = 7 * 4 = 28 bytes
         return 28
 
+    def preload_strings(self):
+        """Decode the whole string table once into the offset -> str cache."""
+        table = bytes(self.data[self.strings_offset:self.strings_offset + self.strings_size])
+        strings = self._strings
+        intern = sys.intern
+        offset = 0
+        for raw in table.split(b'\x00'):
+            if offset not in strings:
+                strings[offset] = intern(decode_modified_utf8(raw))
+            offset += len(raw) + 1
+        return len(strings)
+
     def get_string(self, offset):
-        """Get a null-terminated modified-UTF8 string from the string table."""
+        """Get a null-terminated modified-UTF8 string from the string table.
+
+        Each offset is decoded at most once; the interned result is cached so
+        module and package names shared by thousands of entries are reused.
+        """
+        s = self._strings.get(offset)
+        if s is not None:
+            return s
         if offset < 0 or offset >= self.strings_size:
             return ""
         start = self.strings_offset + offset
-        end = self.data.index(b'\x00', start)
-        raw = self.data[start:end]
-
-        # Handle compact string format: first byte may encode string with shared prefix
-        # In JIMAGE, strings can start with:
-        # 0x01 = use UTF-8 directly
-        # 0x02..0x7F = use the byte value as a character
-        # 0x80.. = shared prefix encoding
-
-        result = []
-        i = 0
-        while i < len(raw):
-            b = raw[i]
-            if b == 1:
-                # Rest is plain UTF-8
-                return raw[i+1:].decode('utf-8', errors='replace')
-            elif b < 128:
-                result.append(chr(b))
-            else:
-                # Modified UTF-8 multi-byte
-                if (b & 0xE0) == 0xC0 and i + 1 < len(raw):
-                    c = ((b & 0x1F) << 6) | (raw[i+1] & 0x3F)
-                    result.append(chr(c))
-                    i += 1
-                elif (b & 0xF0) == 0xE0 and i + 2 < len(raw):
-                    c = ((b & 0x0F) << 12) | ((raw[i+1] & 0x3F) << 6) | (raw[i+2] & 0x3F)
-                    result.append(chr(c))
-                    i += 2
-                else:
-                    result.append(f'\\x{b:02x}')
-            i += 1
-        return ''.join(result)
+        end = self._buf.find(b'\x00', start, self.strings_offset + self.strings_size)
+        if end < 0:
+            end = self.strings_offset + self.strings_size
+        s = sys.intern(decode_modified_utf8(self.data[start:end]))
+        self._strings[offset] = s
+        return s
+
+    def _decode_attrs(self, loc_offset):
+        """Attribute list of a location (see decode_attributes), or None."""
+        return decode_attributes(self.data, self.locations_offset + loc_offset,
+                                 self.locations_offset + self.locations_size)
 
     def decode_location(self, loc_offset):
-        """Decode a location entry from the locations section."""
-        attrs = {}
+        """Decode a location entry into a {kind: value} dict ({} if invalid)."""
+        attrs = self._decode_attrs(loc_offset)
+        if attrs is None:
+            return {}
+        return {kind: value for kind, value in enumerate(attrs) if value}
+
+    def _entry_from_row(self, module_off, parent_off, base_off, ext_off,
+                        offset, compressed_size, uncompressed_size):
+        module_str = self.get_string(module_off)
+        parent_str = self.get_string(parent_off)
+        base_str = self.get_string(base_off)
+        ext_str = self.get_string(ext_off)
+
+        return {
+            'module': module_str,
+            'parent': parent_str,
+            'base': base_str,
+            'extension': ext_str,
+            'offset': offset,
+            'compressed_size': compressed_size,
+            'uncompressed_size': uncompressed_size,
+            'full_path': build_full_name(module_str, parent_str, base_str, ext_str),
+        }
+
+    def _module_offset(self, loc_offset):
+        """Read only the MODULE attribute of a location (0 if absent).
+
+        Attributes are stored in kind order and zero values are omitted, so
+        MODULE, when present, is always the first one.
+        """
         pos = self.locations_offset + loc_offset
+        kind, count, valid = ATTRIBUTE_HEADERS[self.data[pos]]
+        if kind != ATTRIBUTE_MODULE:
+            return 0
+        if count == 1:
+            return self.data[pos + 1]
+        return int.from_bytes(self.data[pos + 1:pos + 1 + count], 'big')
+
+    def iter_entries(self, modules=None, extensions=None):
+        """Lazily yield entries, optionally restricted to modules/extensions.
+
+        The module filter is applied to the MODULE string offset before the
+        rest of the location is decoded: each distinct offset is resolved to
+        a name once, and non-matching entries cost a single attribute read.
+        The extension is checked before the remaining strings are decoded.
+        Stop iterating as soon as you have what you need.
+        """
+        modules = set(modules) if modules else None
+        extensions = set(extensions) if extensions else None
+        if self.columns is not None:
+            yield from self._iter_columns(modules, extensions)
+            return
+
+        module_match = {}   # module string offset -> wanted?
+        ext_match = {}      # extension string offset -> wanted?
+
+        table = self.data[self.offsets_offset:self.offsets_offset + self.offsets_size]
+        for (loc_offset,) in struct.iter_unpack(self.endian + 'I', table):
+            if loc_offset == 0:
+                continue
 
-        while pos < self.locations_offset + self.locations_size:
-            if pos >= len(self.data):
-                break
-
-            byte = self.data[pos]
-            kind = (byte >> 3) & 0x07
-            length = (byte & 0x07)
-
-            if kind == ATTRIBUTE_END:
-                break
-
-            pos += 1
-            value = 0
-            for i in range(length):
-                if pos < len(self.data):
-                    value = (value << 8) | self.data[pos]
-                    pos += 1
+            if modules is not None:
+                module_off = self._module_offset(loc_offset)
+                wanted = module_match.get(module_off)
+                if wanted is None:
+                    wanted = module_match[module_off] = self.get_string(module_off) in modules
+                if not wanted:
+                    continue
 
-            attrs[kind] = value
+            attrs = self._decode_attrs(loc_offset)
+            if attrs is None or not any(attrs):
+                continue
 
-        return attrs
+            if extensions is not None:
+                ext_off = attrs[ATTRIBUTE_EXTENSION]
+                wanted = ext_match.get(ext_off)
+                if wanted is None:
+                    wanted = ext_match[ext_off] = self.get_string(ext_off) in extensions
+                if not wanted:
+                    continue
+
+            yield self._entry_from_row(*attrs[1:])
+
+    def _iter_columns(self, modules, extensions):
+        """iter_entries over the loaded location columns."""
+        module_col, ext_col = self.columns[0], self.columns[3]
+        module_offs = None
+        if modules is not None:
+            module_offs = {off for off in set(module_col) if self.get_string(off) in modules}
+        ext_offs = None
+        if extensions is not None:
+            ext_offs = {off for off in set(ext_col) if self.get_string(off) in extensions}
+        for i, row in enumerate(zip(*self.columns)):
+            if module_offs is not None and module_col[i] not in module_offs:
+                continue
+            if ext_offs is not None and ext_col[i] not in ext_offs:
+                continue
+            yield self._entry_from_row(*row)
 
     def list_entries(self, module_filter=None):
         """List all entries, optionally filtered by module name."""
-        entries = []
+        return list(self.iter_entries(modules=[module_filter] if module_filter else None))
+
+    def find_index(self, path):
+        """Return the offsets-table slot for a resource path, or -1.
+
+        Uses the image's perfect hash: redirect[hash(path) % table_length]
+        is negative for a direct slot (-1 - slot), positive for a seed to
+        rehash with, and zero when no resource hashes to that bucket.
+        """
+        count = self.header.table_length
+        if count == 0:
+            return -1
+        bucket = jimage_hash(path) % count
+        redirect = struct.unpack_from(self.endian + 'i', self.data,
+                                      self.redirect_offset + bucket * 4)[0]
+        if redirect < 0:
+            return -1 - redirect
+        if redirect > 0:
+            return jimage_hash(path, redirect) % count
+        return -1
+
+    def find(self, path):
+        """Look up a single resource by full path, e.g.
+        '/ch.iddqd.aoe4.parser/ch/iddqd/aoe4/parser/ReplayParser.class'.
+
+        Returns the entry dict, or None if the image has no such resource.
+        """
+        index = self.find_index(path)
+        if index < 0:
+            return None
+        loc_offset = struct.unpack_from(self.endian + 'I', self.data,
+                                        self.offsets_offset + index * 4)[0]
+        if loc_offset == 0:
+            return None
+        attrs = self._decode_attrs(loc_offset)
+        if attrs is None:
+            return None
+        # A hash hit only narrows it to one slot; the name must still match.
+        entry = self._entry_from_row(*attrs[1:])
+        if entry['full_path'] != path:
+            return None
+        return entry
+
+    def get_resource(self, path):
+        """Return the raw bytes (as a memoryview) of a resource, or None."""
+        entry = self.find(path)
+        if entry is None:
+            return None
+        return self.extract_resource(entry)
 
-        for i in range(self.header.table_length):
-            # Read offset from offsets table
-            off_pos = self.offsets_offset + i * 4
-            if off_pos + 4 > len(self.data):
-                continue
+    def extract_resource(self, entry):
+        """Return a zero-copy memoryview of a resource's raw bytes.
+
+        Call bytes() on the result if the data must outlive the parser.
+        """
+        offset = self.resources_offset + entry['offset']
+        size = entry['compressed_size'] if entry['compressed_size'] > 0 else entry['uncompressed_size']
+        if size == 0:
+            return memoryview(b'')
+        return self.data[offset:offset + size]
 
-            loc_offset = struct.unpack_from(self.endian + 'I', self.data, off_pos)[0]
+    # Directory index: jlink stores a /modules/<module>/<package dirs>
+    # tree of directory nodes, whose content is the u4 location offsets of
+    # their children, and one /packages/<package> node per package, whose
+    # content is (isEmpty u4, module name string offset u4) pairs.
+
+    def _node_content(self, path):
+        """Uncompressed content of a metadata node as array('I'), or None."""
+        entry = self.find(path)
+        if entry is None:
+            return None
+        if entry['compressed_size']:
+            raise ValueError(f"{path}: compressed metadata nodes are not supported")
+        content = array('I')
+        content.frombytes(bytes(self.extract_resource(entry)))
+        if (self.endian == '<') != (sys.byteorder == 'little'):
+            content.byteswap()
+        return content
+
+    def _is_directory(self, loc_offset):
+        """True if the location is a /modules/... or /packages/... node."""
+        return self.get_string(self._module_offset(loc_offset)) in ('modules', 'packages')
+
+    def list_modules(self):
+        """Sorted module names, read from the /modules directory node.
+
+        Returns [] for images without the directory tree.
+        """
+        children = self._node_content('/modules')
+        if children is None:
+            return []
+        names = []
+        for loc_offset in children:
+            attrs = self._decode_attrs(loc_offset)
+            if attrs is not None:
+                # base of /modules/<name> is the module name itself
+                names.append(self.get_string(attrs[ATTRIBUTE_BASE]))
+        return sorted(names)
+
+    def list_packages(self):
+        """Map each package name to [(module, is_empty), ...] via /packages."""
+        children = self._node_content('/packages')
+        if children is None:
+            return {}
+        packages = {}
+        for loc_offset in children:
+            attrs = self._decode_attrs(loc_offset)
+            if attrs is None:
+                continue
+            name = self.get_string(attrs[ATTRIBUTE_BASE])
+            pairs = self._node_content('/packages/' + name)
+            packages[name] = [(self.get_string(pairs[i + 1]), bool(pairs[i]))
+                              for i in range(0, len(pairs) - 1, 2)]
+        return packages
+
+    def module_locations(self, module):
+        """Location offsets of every resource of a module.
+
+        Walks the /modules/<module> directory tree; only the MODULE
+        attribute of each child is read to tell directories from resources.
+        Returns [] if the module (or the tree) is not in the image.
+        """
+        found = []
+        pending = ['/modules/' + module]
+        while pending:
+            path = pending.pop()
+            children = self._node_content(path)
+            if children is None:
+                continue
+            for loc_offset in children:
+                if self._is_directory(loc_offset):
+                    attrs = self._decode_attrs(loc_offset)
+                    pending.append('/modules/' + self.get_string(attrs[ATTRIBUTE_BASE]))
+                else:
+                    found.append(loc_offset)
+        return found
+
+    def resource_locations(self, modules):
+        """Location offsets (array('I')) of every resource in modules.
+
+        modules=None means every module. Uses the /modules tree when the
+        image has one; otherwise scans the offsets table, reading only the
+        MODULE attribute of each location.
+        """
+        found = array('I')
+        names = self.list_modules()
+        if names:
+            for module in names if modules is None else modules:
+                found.extend(self.module_locations(module))
+            return found
+
+        wanted = None if modules is None else set(modules)
+        matches = {}
+        table = self.data[self.offsets_offset:self.offsets_offset + self.offsets_size]
+        for (loc_offset,) in struct.iter_unpack(self.endian + 'I', table):
             if loc_offset == 0:
                 continue
-
-            attrs = self.decode_location(loc_offset)
-            if not attrs:
+            module_off = self._module_offset(loc_offset)
+            hit = matches.get(module_off)
+            if hit is None:
+                hit = matches[module_off] = wanted is None or self.get_string(module_off) in wanted
+            if hit:
+                found.append(loc_offset)
+        return found
+
+    def module_index(self):
+        """Per-module summary from the directory metadata alone.
+
+        Returns {module: {'packages': [names], 'resources': count}}, or {}
+        if the image has no /modules tree.
+        """
+        index = {name: {'packages': [], 'resources': len(self.module_locations(name))}
+                 for name in self.list_modules()}
+        for package, owners in sorted(self.list_packages().items()):
+            for module, is_empty in owners:
+                if module in index and not is_empty:
+                    index[module]['packages'].append(package)
+        return index
+
+    def module_entries(self, module, extensions=None):
+        """Entries of one module in content-offset order.
+
+        Only the module's own locations are decoded (see module_locations),
+        and sorting by offset makes the resource reads sequential.
+        """
+        entries = []
+        for loc_offset in self.module_locations(module):
+            attrs = self._decode_attrs(loc_offset)
+            if attrs is None:
                 continue
+            entry = self._entry_from_row(*attrs[1:])
+            if extensions is None or entry['extension'] in extensions:
+                entries.append(entry)
+        entries.sort(key=lambda e: e['offset'])
+        return entries
 
-            module_str = self.get_string(attrs.get(ATTRIBUTE_MODULE, 0))
-            parent_str = self.get_string(attrs.get(ATTRIBUTE_PARENT, 0))
-            base_str = self.get_string(attrs.get(ATTRIBUTE_BASE, 0))
-            ext_str = self.get_string(attrs.get(ATTRIBUTE_EXTENSION, 0))
 
-            if module_filter and module_str != module_filter:
-                continue
+def make_output_dirs(paths):
+    """Create the parent directory of every path once, up front."""
+    for directory in sorted({os.path.dirname(p) for p in paths}):
+        os.makedirs(directory, exist_ok=True)
 
-            offset = attrs.get(ATTRIBUTE_OFFSET, 0)
-            compressed_size = attrs.get(ATTRIBUTE_COMPRESSED, 0)
-            uncompressed_size = attrs.get(ATTRIBUTE_UNCOMPRESSED, 0)
-
-            # Build full path
-            if ext_str:
-                full_path = f"/{module_str}/{parent_str}{base_str}.{ext_str}"
-            else:
-                full_path = f"/{module_str}/{parent_str}{base_str}"
-
-            entries.append({
-                'module': module_str,
-                'parent': parent_str,
-                'base': base_str,
-                'extension': ext_str,
-                'offset': offset,
-                'compressed_size': compressed_size,
-                'uncompressed_size': uncompressed_size,
-                'full_path': full_path,
-            })
 
-        return entries
+@contextlib.contextmanager
+def atomic_open(path):
+    """Open path + '.tmp' for binary writing; it replaces path only if the block succeeds.
 
-    def extract_resource(self, entry):
-        """Extract raw bytes of a resource."""
-        offset = self.resources_offset + entry['offset']
-        size = entry['compressed_size'] if entry['compressed_size'] > 0 else entry['uncompressed_size']
-        if size == 0:
-            return b''
-        return self.data[offset:offset + size]
+    An interrupted or failed write never leaves a partial file at path.
+    """
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            yield f
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    os.replace(tmp_path, path)
 
 
-def main():
-    jimage_path = "C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/lib/modules"
-    output_dir = "C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted"
+def write_file(path, data):
+    with atomic_open(path) as f:
+        f.write(data)
 
-    parser = JImageParser(jimage_path)
+
+def write_files(items, jobs=1):
+    """Write (path, data) pairs, through a thread pool when jobs > 1.
+
+    Parent directories must already exist (see make_output_dirs).
+    """
+    if jobs <= 1:
+        for path, data in items:
+            write_file(path, data)
+        return
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for future in [pool.submit(write_file, path, data) for path, data in items]:
+            future.result()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="List and extract the AoE4 parser classes from a JIMAGE file.")
+    ap.add_argument('jimage_path', nargs='?',
+                    default="C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/lib/modules")
+    ap.add_argument('output_dir', nargs='?',
+                    default="C:/Users/fermi/aoe4-replay-viewer/tools/aoe4analyzer/extracted")
+    ap.add_argument('--jobs', '-j', type=int, default=1,
+                    help="number of threads writing class files (default: 1)")
+    ap.add_argument('--no-cache', action='store_true',
+                    help="do not read or write the on-disk location index cache")
+    ap.add_argument('--cache-dir',
+                    help="directory for the index cache (default: next to the image)")
+    args = ap.parse_args()
+    output_dir = args.output_dir
+
+    parser = JImageParser(args.jimage_path, use_mmap=True)
+    # Walk the /modules tree when the image has one; otherwise filter a scan
+    use_tree = bool(parser.list_modules())
+    if not use_tree and not args.no_cache:
+        parser.load_index(args.cache_dir)
+
+    def module_entries(module, extensions=None):
+        if use_tree:
+            return parser.module_entries(module, extensions)
+        return list(parser.iter_entries(modules=[module], extensions=extensions))
 
     # List parser module entries
     print("\n=== Classes in ch.iddqd.aoe4.parser ===")
-    parser_entries = parser.list_entries(module_filter="ch.iddqd.aoe4.parser")
+    parser_entries = module_entries("ch.iddqd.aoe4.parser")
     for entry in sorted(parser_entries, key=lambda e: e['full_path']):
         print(f"  {entry['full_path']} (size={entry['uncompressed_size']})")
 
@@ -266,38 +847,33 @@ def main():
 
     # Also list GUI module
     print("\n=== Classes in ch.iddqd.aoe4.aoe4replayparsergui ===")
-    gui_entries = parser.list_entries(module_filter="ch.iddqd.aoe4.aoe4replayparsergui")
+    gui_entries = module_entries("ch.iddqd.aoe4.aoe4replayparsergui")
     for entry in sorted(gui_entries, key=lambda e: e['full_path']):
         print(f"  {entry['full_path']} (size={entry['uncompressed_size']})")
 
     print(f"\nTotal entries in GUI module: {len(gui_entries)}")
 
     # Extract class files for parser module
-    class_entries = [e for e in parser_entries if e['extension'] == 'class']
+    class_entries = module_entries("ch.iddqd.aoe4.parser", ["class"])
     print(f"\nExtracting {len(class_entries)} class files from parser module...")
 
-    for entry in class_entries:
-        rel_path = entry['full_path'].lstrip('/')
-        out_path = os.path.join(output_dir, rel_path)
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        data = parser.extract_resource(entry)
-        with open(out_path, 'wb') as f:
-            f.write(data)
+    out_paths = [os.path.join(output_dir, e['full_path'].lstrip('/')) for e in class_entries]
+    make_output_dirs(out_paths)
+    write_files(((p, parser.extract_resource(e)) for p, e in zip(out_paths, class_entries)),
+                jobs=args.jobs)
 
     print(f"Extracted to: {output_dir}")
 
     # Also extract GUI module classes
-    gui_class_entries = [e for e in gui_entries if e['extension'] == 'class']
+    gui_class_entries = module_entries("ch.iddqd.aoe4.aoe4replayparsergui", ["class"])
     print(f"\nExtracting {len(gui_class_entries)} class files from GUI module...")
 
-    for entry in gui_class_entries:
-        rel_path = entry['full_path'].lstrip('/')
-        out_path = os.path.join(output_dir, rel_path)
-        os.makedirs(os.path.dirname(out_path), exist_ok=True)
-        data = parser.extract_resource(entry)
-        with open(out_path, 'wb') as f:
-            f.write(data)
+    out_paths = [os.path.join(output_dir, e['full_path'].lstrip('/')) for e in gui_class_entries]
+    make_output_dirs(out_paths)
+    write_files(((p, parser.extract_resource(e)) for p, e in zip(out_paths, gui_class_entries)),
+                jobs=args.jobs)
 
+    parser.close()
     print("Done!")
 
 
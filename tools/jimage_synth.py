@@ -0,0 +1,491 @@
+"""
+Generate synthetic JIMAGE (lib/modules) files for testing and benchmarking
+the JIMAGE tools without a real AoE4 analyzer or JDK image.
+
+The output follows the layout jlink writes:
+  - 7-word header, perfect-hash redirect table, offsets table
+  - location attributes, NUL-terminated string table (offset 0 = "")
+  - resource content: valid class files, optionally compressed with the
+    'zip' and/or 'compact-cp' plugins behind a CompressedResourceHeader
+  - /modules/... directory and /packages/... metadata locations
+
+Knobs: resource count, module count, packages per module, the share of
+zip / compact-cp compressed resources, and how often class names repeat
+across packages (string sharing).
+
+Usage:
+  python jimage_synth.py out/modules --resources 20000 --modules 40 --zip 0.5
+"""
+
+import argparse
+import random
+import re
+import struct
+import zlib
+
+from extract_jimage import (COMPRESSED_HEADER_FORMAT, COMPRESSED_HEADER_MAGIC, CONSTANT_DOUBLE,
+                           CONSTANT_LONG, CONSTANT_SIZES, CONSTANT_UTF8, EXTERNALIZED_STRING,
+                           EXTERNALIZED_STRING_DESCRIPTOR)
+from jimage_parser import HASH_MULTIPLIER, JIMAGE_MAGIC_INVERTED, jimage_hash
+
+JIMAGE_VERSION = (1 << 16) | 0
+
+# Modules the extraction tools look for by default come first
+DEFAULT_MODULES = ['ch.iddqd.aoe4.parser', 'ch.iddqd.aoe4.aoe4replayparsergui']
+
+# Class names reused across packages when string sharing is on
+SHARED_NAMES = ['Util', 'Parser', 'Command', 'Type', 'Entry', 'Builder', 'Factory',
+                'Reader', 'Writer', 'Info', 'Provider', 'Filter', 'Handler', 'Message']
+
+PERFECT_HASH_RETRY_LIMIT = 1000
+
+
+class StringTable:
+    """Deduplicating string table writer; offset 0 is the empty string."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = {}
+        self.add('')
+
+    def add(self, s):
+        offset = self.offsets.get(s)
+        if offset is None:
+            offset = self.offsets[s] = len(self.data)
+            self.data += s.encode('utf-8') + b'\x00'
+        return offset
+
+
+def split_full_name(full_name):
+    """Split a resource name into (module, parent, base, extension).
+
+    Mirrors jlink's ImageLocationWriter.newLocation: /modules/... and
+    /packages/... keep everything after the prefix as the base name.
+    """
+    for prefix in ('modules', 'packages'):
+        if full_name.startswith(f'/{prefix}/'):
+            return prefix, '', full_name[len(prefix) + 2:], ''
+
+    module = parent = extension = ''
+    name = full_name
+    offset = name.find('/', 1)
+    if len(name) >= 2 and name[0] == '/' and offset != -1:
+        module = name[1:offset]
+        name = name[offset + 1:]
+    offset = name.rfind('/')
+    if offset > 1:
+        parent = name[:offset]
+        name = name[offset + 1:]
+    offset = name.rfind('.')
+    if offset != -1:
+        name, extension = name[:offset], name[offset + 1:]
+    return module, parent, name, extension
+
+
+def encode_location(attributes):
+    """Encode location attributes (kind -> value); zero values are omitted."""
+    out = bytearray()
+    for kind in range(1, 8):
+        value = attributes.get(kind, 0)
+        if value == 0:
+            continue
+        length = max(1, (value.bit_length() + 7) // 8)
+        out.append((kind << 3) | (length - 1))
+        out += value.to_bytes(length, 'big')
+    out.append(0)  # END
+    return bytes(out)
+
+
+def build_perfect_hash(names):
+    """Return (redirect, order) like jlink's PerfectHashBuilder.
+
+    redirect[hash % n] is -1 - slot for single-entry buckets, or the seed
+    that spreads a multi-entry bucket without collisions; order[slot] is
+    the name stored in that slot.
+    """
+    count = len(names)
+    while True:
+        redirect = [0] * count
+        order = [None] * count
+        buckets = {}
+        for name in names:
+            buckets.setdefault(jimage_hash(name) % count, []).append(name)
+
+        ok = True
+        free = 0
+        for bucket in sorted(buckets.values(), key=len, reverse=True):
+            if len(bucket) > 1:
+                seed = HASH_MULTIPLIER + 1
+                for _ in range(PERFECT_HASH_RETRY_LIMIT):
+                    slots = [jimage_hash(name, seed) % count for name in bucket]
+                    if len(set(slots)) == len(slots) and all(order[i] is None for i in slots):
+                        break
+                    seed += 1
+                else:
+                    ok = False
+                    break
+                for name, i in zip(bucket, slots):
+                    order[i] = name
+                redirect[jimage_hash(bucket[0]) % count] = seed
+            else:
+                while order[free] is not None:
+                    free += 1
+                order[free] = bucket[0]
+                redirect[jimage_hash(bucket[0]) % count] = -1 - free
+                free += 1
+        if ok:
+            return redirect, order
+        count = (count + 1) | 1
+
+
+class ConstantPool:
+    """Minimal class file constant pool builder."""
+
+    def __init__(self):
+        self.entries = []
+        self.index = {}
+
+    def _add(self, key, blob, wide=False):
+        i = self.index.get(key)
+        if i is None:
+            i = self.index[key] = len(self.entries) + 1
+            self.entries.append(blob)
+            if wide:
+                self.entries.append(b'')
+        return i
+
+    def utf8(self, s):
+        raw = s.encode('utf-8')
+        return self._add(('Utf8', s), b'\x01' + struct.pack('>H', len(raw)) + raw)
+
+    def cls(self, name):
+        return self._add(('Class', name), b'\x07' + struct.pack('>H', self.utf8(name)))
+
+    def string(self, s):
+        return self._add(('String', s), b'\x08' + struct.pack('>H', self.utf8(s)))
+
+    def integer(self, v):
+        return self._add(('Integer', v), b'\x03' + struct.pack('>i', v))
+
+    def long(self, v):
+        return self._add(('Long', v), b'\x05' + struct.pack('>q', v), wide=True)
+
+    def name_and_type(self, name, desc):
+        return self._add(('NameAndType', name, desc),
+                         b'\x0c' + struct.pack('>HH', self.utf8(name), self.utf8(desc)))
+
+    def methodref(self, owner, name, desc):
+        return self._add(('Methodref', owner, name, desc),
+                         b'\x0a' + struct.pack('>HH', self.cls(owner), self.name_and_type(name, desc)))
+
+    def to_bytes(self):
+        return struct.pack('>H', len(self.entries) + 1) + b''.join(self.entries)
+
+
+def make_class_file(name, super_name='java/lang/Object', interfaces=(), fields=(),
+                    methods=(), strings=(), ints=(), refs=(), access=0x0021):
+    """Build a valid class file.
+
+    fields are (access, name, descriptor, constant or None) and methods are
+    (access, name, descriptor); every method gets a one-byte Code attribute.
+    """
+    cp = ConstantPool()
+    this_idx = cp.cls(name)
+    super_idx = cp.cls(super_name) if super_name else 0
+    iface_idx = [cp.cls(i) for i in interfaces]
+    for s in strings:
+        cp.string(s)
+    for v in ints:
+        cp.integer(v)
+    for owner, mname, desc in refs:
+        cp.methodref(owner, mname, desc)
+
+    body = bytearray(struct.pack('>HHH', access, this_idx, super_idx))
+    body += struct.pack('>H', len(iface_idx))
+    for i in iface_idx:
+        body += struct.pack('>H', i)
+
+    body += struct.pack('>H', len(fields))
+    for facc, fname, fdesc, const in fields:
+        if const is None:
+            body += struct.pack('>HHHH', facc, cp.utf8(fname), cp.utf8(fdesc), 0)
+            continue
+        if isinstance(const, str):
+            cv = cp.string(const)
+        elif fdesc == 'J':
+            cv = cp.long(const)
+        else:
+            cv = cp.integer(const)
+        body += struct.pack('>HHHH', facc, cp.utf8(fname), cp.utf8(fdesc), 1)
+        body += struct.pack('>HIH', cp.utf8('ConstantValue'), 2, cv)
+
+    code = struct.pack('>HHI', 1, 1, 1) + b'\xb1' + struct.pack('>HH', 0, 0)
+    body += struct.pack('>H', len(methods))
+    for macc, mname, mdesc in methods:
+        body += struct.pack('>HHHH', macc, cp.utf8(mname), cp.utf8(mdesc), 1)
+        body += struct.pack('>HI', cp.utf8('Code'), len(code)) + code
+
+    body += struct.pack('>H', 0)  # class attributes
+    return b'\xca\xfe\xba\xbe' + struct.pack('>HH', 0, 61) + cp.to_bytes() + bytes(body)
+
+
+# ---------------------------------------------------------------------------
+# Resource compression (the inverse of extract_jimage's decompressors)
+# ---------------------------------------------------------------------------
+
+DESCRIPTOR_CLASS = re.compile(r'L([^;]*);')
+
+
+def compress_index(value):
+    """CompressIndexes encoding: 1-3 bytes with a size header, else 4 bytes."""
+    size = min(((value.bit_length() + 4) >> 3) + 1, 4)
+    out = bytearray((value >> ((size - i - 1) * 8)) & 0xFF for i in range(size))
+    if size < 4:
+        out[0] |= 0x80 | (size << 5)
+    return bytes(out)
+
+
+def compressed_header(payload_size, uncompressed_size, name_offset, is_terminal, endian='<'):
+    return struct.pack(endian + COMPRESSED_HEADER_FORMAT, COMPRESSED_HEADER_MAGIC, payload_size,
+                       uncompressed_size, name_offset, 0, 1 if is_terminal else 0)
+
+
+def compact_cp(class_bytes, strings):
+    """Move a class file's Utf8 constants into the image string table.
+
+    Descriptors that mention classes become tag 25 (stripped descriptor plus
+    package/class string indexes), other Utf8 entries become tag 23.
+    """
+    out = bytearray(class_bytes[:10])
+    count = struct.unpack_from('>H', class_bytes, 8)[0]
+    pos = 10
+    i = 1
+    while i < count:
+        tag = class_bytes[pos]
+        pos += 1
+        if tag == CONSTANT_UTF8:
+            length = struct.unpack_from('>H', class_bytes, pos)[0]
+            s = class_bytes[pos + 2:pos + 2 + length].decode('utf-8')
+            pos += 2 + length
+            if s[:1] in ('(', 'L', '[') and DESCRIPTOR_CLASS.search(s):
+                indexes = []
+
+                def strip(m):
+                    pkg, _, simple = m.group(1).rpartition('/')
+                    indexes.append(strings.add(pkg))
+                    indexes.append(strings.add(simple))
+                    return 'L;'
+
+                desc = DESCRIPTOR_CLASS.sub(strip, s)
+                flow = b''.join(compress_index(x) for x in indexes)
+                out += bytes([EXTERNALIZED_STRING_DESCRIPTOR]) + compress_index(strings.add(desc))
+                out += compress_index(len(flow)) + flow
+            else:
+                out += bytes([EXTERNALIZED_STRING]) + compress_index(strings.add(s))
+        else:
+            size = CONSTANT_SIZES[tag]
+            out.append(tag)
+            out += class_bytes[pos:pos + size]
+            pos += size
+            if tag in (CONSTANT_LONG, CONSTANT_DOUBLE):
+                i += 1
+        i += 1
+    out += class_bytes[pos:]
+    return bytes(out)
+
+
+def compress_resource(content, strings, use_compact_cp=False, use_zip=False, endian='<'):
+    """Apply compact-cp and/or zip (zip outermost), each behind its header."""
+    if use_compact_cp:
+        payload = compact_cp(content, strings)
+        content = compressed_header(len(payload), len(content), strings.add('compact-cp'),
+                                    True, endian) + payload
+    if use_zip:
+        payload = zlib.compress(content)
+        content = compressed_header(len(payload), len(content), strings.add('zip'),
+                                    not use_compact_cp, endian) + payload
+    return content
+
+
+# ---------------------------------------------------------------------------
+# Image writer
+# ---------------------------------------------------------------------------
+
+class ImageWriter:
+    """Collects resources and writes them as a JIMAGE file."""
+
+    def __init__(self, endian='<'):
+        self.endian = endian
+        self.strings = StringTable()
+        self.content = bytearray()
+        self.locations = {}   # full name -> attributes
+        self.resources = []   # full names of real (non-metadata) resources
+
+    def add_resource(self, full_name, content, use_compact_cp=False, use_zip=False):
+        stored = content
+        if use_compact_cp or use_zip:
+            stored = compress_resource(content, self.strings, use_compact_cp, use_zip, self.endian)
+        self._add_location(full_name, stored, len(content) if stored is not content else None)
+        self.resources.append(full_name)
+
+    def _add_location(self, full_name, stored, uncompressed_size=None):
+        module, parent, base, ext = split_full_name(full_name)
+        offset = len(self.content)
+        self.content += stored
+        self.locations[full_name] = {
+            1: self.strings.add(module),
+            2: self.strings.add(parent),
+            3: self.strings.add(base),
+            4: self.strings.add(ext),
+            5: offset,
+            6: len(stored) if uncompressed_size is not None else 0,
+            7: uncompressed_size if uncompressed_size is not None else len(stored),
+        }
+
+    def _directory_tree(self):
+        """The /modules and /packages directory nodes for all resources."""
+        dirs = {'/modules': set(), '/packages': set()}
+        packages = {}
+        for name in self.resources:
+            module, parent, base, ext = split_full_name(name)
+            path = f'/modules/{module}'
+            dirs['/modules'].add(path)
+            dirs.setdefault(path, set())
+            for part in parent.split('/') if parent else []:
+                child = f'{path}/{part}'
+                dirs[path].add(child)
+                dirs.setdefault(child, set())
+                path = child
+            dirs[path].add(name)
+            if parent:
+                packages.setdefault(parent.replace('/', '.'), set()).add(module)
+        for pkg in packages:
+            dirs['/packages'].add(f'/packages/{pkg}')
+        return dirs, packages
+
+    def write(self, path, include_tree=True):
+        dirs, packages = self._directory_tree() if include_tree else ({}, {})
+
+        # Metadata locations first so that every name has a location, then
+        # their content once all location offsets are known.
+        for pkg in sorted(packages):
+            self._add_location(f'/packages/{pkg}', b'\x00' * (8 * len(packages[pkg])))
+        for d in sorted(dirs):
+            self._add_location(d, b'\x00' * (4 * len(dirs[d])))
+
+        names = list(self.locations)
+        redirect, order = build_perfect_hash(names) if names else ([], [])
+
+        locations = bytearray(b'\x00')  # offset 0 means "no location"
+        offsets = []
+        location_offset = {}
+        for name in order:
+            if name is None:
+                offsets.append(0)
+                continue
+            location_offset[name] = len(locations)
+            offsets.append(len(locations))
+            locations += encode_location(self.locations[name])
+
+        u4 = self.endian + 'I'
+        for pkg, modules in packages.items():
+            pos = self.locations[f'/packages/{pkg}'][5]
+            for module in sorted(modules):
+                struct.pack_into(self.endian + 'II', self.content, pos, 0, self.strings.add(module))
+                pos += 8
+        for d, children in dirs.items():
+            pos = self.locations[d][5]
+            for child in sorted(children):
+                struct.pack_into(u4, self.content, pos, location_offset[child])
+                pos += 4
+
+        table_length = len(order)
+        # 0xCAFEDADA in image byte order; JImageHeader reads it back little-endian
+        header = struct.pack(self.endian + '7I', JIMAGE_MAGIC_INVERTED, JIMAGE_VERSION, 0,
+                             len(names), table_length, len(locations), len(self.strings.data))
+        with open(path, 'wb') as f:
+            f.write(header)
+            f.write(struct.pack(f'{self.endian}{table_length}i', *redirect))
+            f.write(struct.pack(f'{self.endian}{table_length}I', *offsets))
+            f.write(locations)
+            f.write(self.strings.data)
+            f.write(self.content)
+
+
+def generate_image(path, resources=2000, modules=8, packages_per_module=10,
+                   zip_ratio=0.5, compact_cp_ratio=0.0, shared_names=0.3,
+                   members=20, seed=0, endian='<', include_tree=True):
+    """Write a synthetic JIMAGE to path and return its list of class resource names.
+
+    members sets how many fields, methods and string constants each class
+    gets (and so the typical class size). zip_ratio / compact_cp_ratio are
+    the share of resources compressed with each plugin; a resource that
+    draws both is stacked (zip around compact-cp). shared_names is the
+    share of classes named from a small common pool instead of uniquely.
+    """
+    rnd = random.Random(seed)
+    module_names = (DEFAULT_MODULES + [f'synth.mod{i}' for i in range(max(0, modules - 2))])[:modules]
+    writer = ImageWriter(endian)
+
+    for i in range(resources):
+        module = module_names[i % len(module_names)]
+        package = f"{module.replace('.', '/')}/pkg{rnd.randrange(packages_per_module)}"
+        if rnd.random() < shared_names:
+            simple = f"{rnd.choice(SHARED_NAMES)}{i % 7}"
+        else:
+            simple = f"Synth{i}"
+        class_name = f'{package}/{simple}'
+        full_name = f'/{module}/{class_name}.class'
+        if full_name in writer.locations:
+            full_name = f'/{module}/{class_name}_{i}.class'
+            class_name = f'{class_name}_{i}'
+
+        content = make_class_file(
+            class_name,
+            super_name=rnd.choice(['java/lang/Object', f'{package}/Base']),
+            interfaces=[f'{package}/Marker'] if i % 3 == 0 else [],
+            fields=[(0x0019, f'FIELD_{j}', 'I', rnd.randrange(1 << 16)) for j in range(members // 2)] +
+                   [(0x0002, f'ref{j}', f'L{package}/Other{j % 5};', None) for j in range(members // 2)],
+            methods=[(0x0001, f'method{j}', f'(IL{package}/Arg;[Ljava/lang/String;)V')
+                     for j in range(members)],
+            strings=[f'string constant {i}.{j}' for j in range(members)],
+            ints=[100000 + i * members + j for j in range(members // 4)],
+            refs=[('java/lang/Object', '<init>', '()V')],
+        )
+        writer.add_resource(full_name, content,
+                            use_compact_cp=rnd.random() < compact_cp_ratio,
+                            use_zip=rnd.random() < zip_ratio)
+
+    writer.write(path, include_tree=include_tree)
+    return writer.resources
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write a synthetic JIMAGE (lib/modules) file.")
+    ap.add_argument('output')
+    ap.add_argument('--resources', type=int, default=2000, help="number of class files")
+    ap.add_argument('--modules', type=int, default=8)
+    ap.add_argument('--packages', type=int, default=10, help="packages per module")
+    ap.add_argument('--zip', type=float, default=0.5, help="share of zip-compressed resources")
+    ap.add_argument('--compact-cp', type=float, default=0.0,
+                    help="share of compact-cp (string sharing) compressed resources")
+    ap.add_argument('--shared-names', type=float, default=0.3,
+                    help="share of classes with names repeated across packages")
+    ap.add_argument('--members', type=int, default=20,
+                    help="fields/methods/strings per class (controls class size)")
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--big-endian', action='store_true')
+    ap.add_argument('--no-tree', action='store_true', help="omit /modules and /packages metadata")
+    args = ap.parse_args()
+
+    names = generate_image(args.output, resources=args.resources, modules=args.modules,
+                           packages_per_module=args.packages, zip_ratio=args.zip,
+                           compact_cp_ratio=args.compact_cp, shared_names=args.shared_names,
+                           members=args.members, seed=args.seed,
+                           endian='>' if args.big_endian else '<',
+                           include_tree=not args.no_tree)
+    print(f"Wrote {len(names)} resources to {args.output}")
+
+
+if __name__ == '__main__':
+    main()